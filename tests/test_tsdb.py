@@ -5,13 +5,49 @@ TSDB unit testing cases.
 # Created by Wenjie Du <wenjay.du@gmail.com>
 # License: BSD-3-Clause
 
+import functools
+import gzip
+import hashlib
+import io
+import json
 import os
+import signal
+import tarfile
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
+import zipfile
+from collections.abc import Mapping
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
 
 import tsdb
-from tsdb.database import DATABASE
-from tsdb.utils.config import PYPOTS_ECOSYSTEM_CONFIG_PATH, read_configs
+from tsdb import data_processing
+from tsdb.database import CHECKSUMS, DATABASE
+from tsdb.utils.cache import (
+    get_cache_path,
+    save_cache,
+    load_cache,
+    read_partition_index,
+)
+from tsdb.utils.config import (
+    PYPOTS_ECOSYSTEM_CONFIG_PATH,
+    read_configs,
+    write_configs,
+)
+from tsdb.utils import blob_store, downloading, shared_memory
+from tsdb.utils.dtypes import encode_labels
+from tsdb.utils.file import get_freeable_size, get_size
+from tsdb.utils.locking import FileLock, get_lock_path
 from tsdb.utils.logging import Logger
+from tsdb.utils.memory_cache import MemoryCache
 
 DATASETS_TO_TEST = [
     "physionet_2012",
@@ -28,6 +64,154 @@ DATASETS_TO_TEST = [
 ]
 
 
+def make_fake_ett(tsdb_home: str) -> str:
+    # raw files of electricity_transformer_temperature, so that tsdb.load() can run offline
+    dataset_dir = os.path.join(tsdb_home, "electricity_transformer_temperature")
+    os.makedirs(dataset_dir)
+    for name in ["ETTm1", "ETTm2", "ETTh1", "ETTh2"]:
+        df = pd.DataFrame(
+            np.random.randn(10, 7),
+            columns=["HUFL", "HULL", "MUFL", "MULL", "LUFL", "LULL", "OT"],
+        )
+        df.insert(0, "date", pd.date_range("2016-07-01", periods=10, freq="h"))
+        df.to_csv(os.path.join(dataset_dir, f"{name}.csv"), index=False)
+    return dataset_dir
+
+
+def make_fake_physionet2019(tsdb_home: str) -> str:
+    # raw files of physionet_2019, 6 patients per set with 5 hours each
+    dataset_dir = os.path.join(tsdb_home, "physionet_2019")
+    for set_name, prefix in [("training", "pa"), ("training_setB", "pb")]:
+        os.makedirs(os.path.join(dataset_dir, set_name))
+        for i in range(6):
+            df = pd.DataFrame(np.random.randn(5, 2), columns=["HR", "O2Sat"])
+            df["SepsisLabel"] = 0
+            df.to_csv(
+                os.path.join(dataset_dir, set_name, f"{prefix}{i}.psv"),
+                sep="|",
+                index=False,
+            )
+    return dataset_dir
+
+
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class RangeRequestHandler(QuietRequestHandler):
+    # SimpleHTTPRequestHandler ignores Range headers, serve "bytes=<start>-[<end>]" ranges for testing
+    range_requests = []
+
+    def send_head(self):
+        if "Range" not in self.headers:
+            return super().send_head()
+        RangeRequestHandler.range_requests.append(self.headers["Range"])
+        start, end = self.headers["Range"].split("=")[1].split("-")
+        with open(self.translate_path(self.path), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            start, end = int(start), int(end) if end else size - 1
+            f.seek(start)
+            body = io.BytesIO(f.read(end - start + 1))
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        return body
+
+
+class MisalignedRangeRequestHandler(RangeRequestHandler):
+    # serves ranges from byte 100000 whatever is requested, for testing ranges not following the partial file
+    def send_head(self):
+        if "Range" not in self.headers:
+            return super().send_head()
+        requested_range = self.headers["Range"]
+        self.headers.replace_header("Range", "bytes=100000-")
+        body = super().send_head()
+        RangeRequestHandler.range_requests[-1] = requested_range
+        return body
+
+
+class FlakyRequestHandler(QuietRequestHandler):
+    # answers 503 to the first requests, for testing retries
+    failures_left = 0
+
+    def send_head(self):
+        if FlakyRequestHandler.failures_left > 0:
+            FlakyRequestHandler.failures_left -= 1
+            self.send_error(503)
+            return None
+        return super().send_head()
+
+
+class RecordingRequestHandler(QuietRequestHandler):
+    # records the requested paths, for testing which files are re-fetched
+    requested_paths = []
+
+    def send_head(self):
+        RecordingRequestHandler.requested_paths.append(self.path)
+        return super().send_head()
+
+
+class SlowRequestHandler(QuietRequestHandler):
+    # sends bodies in 1 KB chunks every 10 ms, for testing interrupted downloads
+    def copyfile(self, source, outputfile):
+        try:
+            for chunk in iter(functools.partial(source.read, 1024), b""):
+                outputfile.write(chunk)
+                time.sleep(0.01)
+        except OSError:
+            # the client went away
+            pass
+
+
+@contextmanager
+def override_configs(key_value_set: dict):
+    # write the given options into config.ini, then restore the file as the developer had it
+    with open(PYPOTS_ECOSYSTEM_CONFIG_PATH, "rb") as f:
+        original_config = f.read()
+    try:
+        write_configs(read_configs(), key_value_set)
+        yield
+    finally:
+        with open(PYPOTS_ECOSYSTEM_CONFIG_PATH, "wb") as f:
+            f.write(original_config)
+
+
+@contextmanager
+def temporary_tsdb_home():
+    # point tsdb_home to a new temporary dir, then purge it and restore the developer's one
+    tsdb_home = data_processing.CACHED_DATASET_DIR
+    data_processing.CACHED_DATASET_DIR = tempfile.mkdtemp()
+    try:
+        yield data_processing.CACHED_DATASET_DIR
+    finally:
+        tsdb.purge_path(data_processing.CACHED_DATASET_DIR)
+        data_processing.CACHED_DATASET_DIR = tsdb_home
+
+
+def serve_directory(directory: str, handler_class=QuietRequestHandler) -> tuple:
+    # a local HTTP server for testing downloads offline
+    handler = functools.partial(handler_class, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def load_in_another_process(tsdb_home: str) -> tuple:
+    data_processing.CACHED_DATASET_DIR = tsdb_home
+    data = tsdb.load("electricity_transformer_temperature", cache_format="parquet")
+    return data["ETTh2"].shape
+
+
+def attach_in_another_process(name: str) -> tuple:
+    with tsdb.attach(name) as data:
+        return (
+            float(data["ETTh1"]["OT"].sum()),
+            data["ETTh1"]["OT"].to_numpy().flags.writeable,
+        )
+
+
 class TestTSDB(unittest.TestCase):
     logger_creator = Logger(name="testing log", logging_level="debug")
     logger = logger_creator.logger
@@ -99,6 +283,986 @@ class TestTSDB(unittest.TestCase):
         configs = read_configs()
         configs.get("path", "tsdb_home")
 
+    def test_7_cache_formats(self):
+        X = pd.DataFrame(
+            np.random.randn(100, 3),
+            columns=["a", "b", "c"],
+            index=pd.date_range("2024-01-01", periods=100, freq="h"),
+        )
+        X["RecordID"] = [str(i // 10) for i in range(100)]
+        result = {
+            "X": X,
+            "y": pd.Series(np.arange(100), name="label"),
+            "static_features": ["a", "b"],
+            "y_classes": ("cat", "dog"),
+            "X_train": np.random.randn(10, 5, 2),
+        }
+        saving_dir = tempfile.mkdtemp()
+        for cache_format in ["pickle", "parquet", "feather"]:
+            for compression in ["zstd", "lz4", "none"]:
+                cache_path = get_cache_path(saving_dir, "synthetic", cache_format)
+                save_cache(result, cache_path, cache_format, compression)
+                loaded = load_cache(cache_path, cache_format)
+                pd.testing.assert_frame_equal(loaded["X"], X, check_freq=False)
+                pd.testing.assert_series_equal(loaded["y"], result["y"])
+                assert loaded["static_features"] == result["static_features"]
+                assert loaded["y_classes"] == result["y_classes"]
+                np.testing.assert_array_equal(loaded["X_train"], result["X_train"])
+
+        # a compression level without a codec is ignored, the frames are still saved in the columnar format
+        for cache_format in ["parquet", "feather"]:
+            cache_path = get_cache_path(saving_dir, "leveled", cache_format)
+            save_cache(result, cache_path, cache_format, "none", compression_level=3)
+            with open(os.path.join(cache_path, "manifest.json")) as f:
+                assert json.load(f)["keys"]["X"]["type"] == "DataFrame"
+            loaded = load_cache(cache_path, cache_format, columns=["a"])
+            assert loaded["X"].columns.tolist() == ["a"]
+
+        # ndarray values in columnar caches can be memory-mapped
+        cache_path = get_cache_path(saving_dir, "synthetic", "parquet")
+        loaded = load_cache(cache_path, "parquet", mmap=True)
+        assert isinstance(loaded["X_train"], np.memmap)
+        np.testing.assert_array_equal(loaded["X_train"], result["X_train"])
+        del loaded
+
+        # a lazy handle only reads the values touched
+        lazy_dataset = load_cache(cache_path, "parquet", lazy=True)
+        assert set(lazy_dataset.keys()) == set(result.keys())
+        assert lazy_dataset.loaded_keys == []
+        pd.testing.assert_frame_equal(lazy_dataset["X"], X, check_freq=False)
+        assert lazy_dataset.loaded_keys == ["X"]
+
+        # columns and filters are pushed down to the columnar cache
+        for cache_format in ["parquet", "feather"]:
+            cache_path = get_cache_path(saving_dir, "synthetic", cache_format)
+            loaded = load_cache(
+                cache_path,
+                cache_format,
+                columns=["a", "RecordID"],
+                filters=[("RecordID", "in", ["1", "2"])],
+            )
+            assert loaded["X"].columns.tolist() == ["a", "RecordID"]
+            assert len(loaded["X"]) == 20
+            pd.testing.assert_index_equal(
+                loaded["X"].index, X.index[10:30], check_exact=False
+            )
+            # an empty list filters out no row
+            loaded = load_cache(cache_path, cache_format, filters=[])
+            pd.testing.assert_frame_equal(loaded["X"], X, check_freq=False)
+
+        # row groups of parquet caches that cannot match the filters are skipped, even if they are corrupted
+        S = pd.DataFrame(
+            {"station": np.repeat([f"s{i}" for i in range(8)], 500), "v": 1.0}
+        )
+        cache_path = get_cache_path(saving_dir, "stations", "parquet")
+        save_cache({"S": S}, cache_path, "parquet", row_group_rows=500)
+        file_path = os.path.join(cache_path, "S.parquet")
+        metadata = pq.ParquetFile(file_path).metadata
+        assert metadata.num_row_groups == 8
+        with open(file_path, "r+b") as f:
+            for i in range(metadata.num_row_groups):
+                for j in range(metadata.num_columns):
+                    column_chunk = metadata.row_group(i).column(j)
+                    if i != 3:
+                        f.seek(
+                            column_chunk.dictionary_page_offset
+                            if column_chunk.has_dictionary_page
+                            else column_chunk.data_page_offset
+                        )
+                        f.write(b"\0" * column_chunk.total_compressed_size)
+        loaded = load_cache(cache_path, "parquet", filters=[("station", "=", "s3")])
+        pd.testing.assert_frame_equal(loaded["S"], S.iloc[1500:2000])
+        with self.assertRaises(OSError):
+            load_cache(cache_path, "parquet")
+
+        # rows selected by filters keep their labels in a RangeIndex, which is kept if no row is filtered out
+        Z = pd.DataFrame({"v": np.arange(10)})
+        for cache_format in ["parquet", "feather"]:
+            cache_path = get_cache_path(saving_dir, "ranged", cache_format)
+            save_cache({"Z": Z}, cache_path, cache_format)
+            loaded = load_cache(
+                cache_path, cache_format, filters=[("v", "in", [1, 3, 5, 7, 9])]
+            )
+            assert loaded["Z"].index.tolist() == [1, 3, 5, 7, 9]
+            loaded = load_cache(cache_path, cache_format)
+            assert isinstance(loaded["Z"].index, pd.RangeIndex)
+        tsdb.purge_path(saving_dir)
+
+    def test_8_memory_cache(self):
+        memory_cache = MemoryCache(max_bytes=2000)
+        array = np.zeros(100)  # 800 bytes
+        assert memory_cache.put("a", {"X": array})
+        assert memory_cache.put("b", {"X": array.copy()})
+        assert memory_cache.get("a") is not None  # "a" becomes the most recently used
+        assert memory_cache.put("c", {"X": array.copy()})  # evicts "b"
+        assert memory_cache.get("b") is None
+        assert memory_cache.get("a", return_copy=False)["X"] is array
+        assert memory_cache.get("a")["X"] is not array
+        assert not memory_cache.put("d", {"X": np.zeros(1000)})  # over the budget
+        info = memory_cache.info()
+        assert [e["key"] for e in info["entries"]] == ["c", "a"]
+        assert info["current_bytes"] <= info["max_bytes"]
+        memory_cache.clear()
+        assert memory_cache.info()["entries"] == []
+        tsdb.memory_cache_info()
+
+    def test_9_stage_fingerprints(self):
+        with temporary_tsdb_home() as tsdb_home:
+            dataset_dir = make_fake_ett(tsdb_home)
+            data = tsdb.load(
+                "electricity_transformer_temperature", cache_format="parquet"
+            )
+            assert data["ETTh1"].shape == (10, 7)
+
+            state_path = os.path.join(dataset_dir, data_processing.STAGE_STATE_NAME)
+            with open(state_path) as f:
+                stage_state = json.load(f)
+            parse_fingerprint = stage_state["caches"]["parquet"]["fingerprint"]
+
+            # a cache stamped by another loading function or TSDB version gets re-generated
+            stage_state["caches"]["parquet"]["fingerprint"] = "stale"
+            with open(state_path, "w") as f:
+                json.dump(stage_state, f)
+            data = tsdb.load("electricity_transformer_temperature", lazy=True)
+            assert isinstance(data, Mapping)
+            assert data["ETTm1"].shape == (10, 7)
+            with open(state_path) as f:
+                stage_state = json.load(f)
+            assert stage_state["caches"]["parquet"]["fingerprint"] == parse_fingerprint
+
+            # sizes and decoding throughput of caches are reported
+            tsdb.load("electricity_transformer_temperature", cache_format="feather")
+            tsdb.load(
+                "electricity_transformer_temperature",
+                cache_format="pickle",
+                compression="zstd",
+            )
+            tsdb.load("electricity_transformer_temperature", cache_format="pickle")
+            report = data_processing.list_cache(detailed=True)
+            assert report[0]["dataset_name"] == "electricity_transformer_temperature"
+            caches = {c["cache_format"]: c for c in report[0]["caches"]}
+            assert caches.keys() == {"parquet", "feather", "pickle"}
+            assert caches["pickle"]["compression"] == "zstd"
+            assert caches["pickle"]["decode_throughput"] > 0
+
+            # pushdown on a pickle cache builds the parquet cache from it, without the raw files
+            parquet_cache_path = get_cache_path(
+                dataset_dir, "electricity_transformer_temperature", "parquet"
+            )
+            tsdb.purge_path(parquet_cache_path)
+            for f in os.listdir(dataset_dir):
+                if f.endswith(".csv"):
+                    os.remove(os.path.join(dataset_dir, f))
+            data = tsdb.load(
+                "electricity_transformer_temperature",
+                cache_format="pickle",
+                columns=["OT"],
+            )
+            assert data["ETTh1"].shape == (10, 1)
+
+            # so does memory mapping, which the pickle cache does not support
+            tsdb.purge_path(parquet_cache_path)
+            data = tsdb.load(
+                "electricity_transformer_temperature", cache_format="pickle", mmap=True
+            )
+            assert data["ETTh1"].shape == (10, 7)
+            assert os.path.exists(parquet_cache_path)
+
+    def test_10_concurrent_loading(self):
+        tsdb_home = tempfile.mkdtemp()
+        try:
+            make_fake_ett(tsdb_home)
+            with ProcessPoolExecutor(max_workers=4) as executor:
+                shapes = list(executor.map(load_in_another_process, [tsdb_home] * 4))
+            assert shapes == [(10, 7)] * 4
+            # no temporary files left by the concurrent cache writes
+            dataset_dir = os.path.join(tsdb_home, "electricity_transformer_temperature")
+            assert not any(f.endswith(".tmp") for f in os.listdir(dataset_dir))
+            assert tsdb.list_cache() is not None
+
+            lock = FileLock(get_lock_path(dataset_dir))
+            with lock, FileLock(get_lock_path(dataset_dir)):  # reentrant
+                pass
+
+            # readers share the lock, keeping the exclusive one, e.g. of eviction, from being taken
+            def try_lock(shared: bool) -> bool:
+                lock = FileLock(get_lock_path(dataset_dir), shared=shared)
+                taken = lock.acquire(blocking=False)
+                if taken:
+                    lock.release()
+                return taken
+
+            with FileLock(get_lock_path(dataset_dir), shared=True):
+                with ThreadPoolExecutor(1) as executor:
+                    assert executor.submit(try_lock, True).result()
+                    assert not executor.submit(try_lock, False).result()
+        finally:
+            tsdb.purge_path(tsdb_home)
+
+    def test_11_disk_quota(self):
+        with temporary_tsdb_home() as tsdb_home:
+            make_fake_ett(tsdb_home)
+            tsdb.load("electricity_transformer_temperature", cache_format="parquet")
+
+            # a dataset loaded long ago, with large raw files and a small cache
+            old_dataset_dir = os.path.join(tsdb_home, "ucr_uea_Wine")
+            os.makedirs(old_dataset_dir)
+            raw_file = os.path.join(old_dataset_dir, "Wine_TRAIN.txt")
+            with open(raw_file, "wb") as f:
+                f.write(b"0" * 100000)
+            cache_file = os.path.join(old_dataset_dir, "ucr_uea_Wine_cache.pkl")
+            with open(cache_file, "wb") as f:
+                f.write(b"0" * 10)
+            with open(
+                os.path.join(old_dataset_dir, data_processing.STAGE_STATE_NAME), "w"
+            ) as f:
+                json.dump({"download": "", "caches": {}, "last_access": 0}, f)
+
+            # raw files are evicted first
+            total_bytes = get_size(tsdb_home)
+            with override_configs(
+                {"cache": {"max_disk_bytes": str(total_bytes - 50000)}}
+            ):
+                data_processing._enforce_disk_quota(
+                    "electricity_transformer_temperature"
+                )
+            assert not os.path.exists(raw_file) and os.path.exists(cache_file)
+
+            # then the whole dataset, but never the one being loaded
+            with override_configs({"cache": {"max_disk_bytes": "1"}}):
+                data_processing._enforce_disk_quota(
+                    "electricity_transformer_temperature"
+                )
+            assert not os.path.exists(old_dataset_dir)
+            assert tsdb.list_cache() == ["electricity_transformer_temperature"]
+
+    def test_12_shared_memory(self):
+        with temporary_tsdb_home() as tsdb_home:
+            make_fake_ett(tsdb_home)
+            # longer than the 31 characters macOS allows for names of shared memory blocks
+            name = f"tsdb_test_electricity_transformer_temperature_{os.getpid()}"
+            assert len(shared_memory._block_name(name, 100)) <= 30
+            shared = tsdb.publish("electricity_transformer_temperature", name=name)
+            data = tsdb.load("electricity_transformer_temperature")
+            pd.testing.assert_frame_equal(shared["ETTh1"], data["ETTh1"])
+
+            with ProcessPoolExecutor(2) as executor:
+                results = list(executor.map(attach_in_another_process, [name] * 2))
+            assert results == [(float(data["ETTh1"]["OT"].sum()), False)] * 2
+
+            # the blocks live until the last holder detaches
+            attached = tsdb.attach(name)
+            shared.detach()
+            assert attached["ETTh1"].shape == data["ETTh1"].shape
+            attached.detach()
+            with self.assertRaises(FileNotFoundError):
+                tsdb.attach(name)
+
+    def test_13_partitioned_cache(self):
+        X = pd.DataFrame(np.random.randn(150, 2), columns=["a", "b"])
+        X["RecordID"] = [f"r{i // 5}" for i in range(150)]
+        result = {"X": X, "y": pd.Series(np.arange(30), name="label")}
+        saving_dir = tempfile.mkdtemp()
+        for cache_format in ["parquet", "feather"]:
+            cache_path = get_cache_path(saving_dir, "synthetic", cache_format)
+            save_cache(
+                result,
+                cache_path,
+                cache_format,
+                partition_key="RecordID",
+                partition_rows=20,
+            )
+            partitions = read_partition_index(cache_path)["X"]
+            assert len(partitions) == 8 and partitions[0]["entities"] == [
+                f"r{i}" for i in range(4)
+            ]
+            loaded = load_cache(cache_path, cache_format)
+            pd.testing.assert_frame_equal(loaded["X"], X)
+            pd.testing.assert_series_equal(loaded["y"], result["y"])
+
+            # only the partition files holding the selected entities are read
+            os.remove(os.path.join(cache_path, partitions[2]["file"]))
+            loaded = load_cache(
+                cache_path, cache_format, entities=["r1", "r17"], columns=["a"]
+            )
+            expected = X.loc[X["RecordID"].isin(["r1", "r17"]), ["a"]]
+            pd.testing.assert_frame_equal(loaded["X"], expected)
+            loaded = load_cache(cache_path, cache_format, partitions=[7, 100])
+            pd.testing.assert_frame_equal(loaded["X"], X.iloc[140:])
+
+            # rows of interleaved entities are read back in their original order
+            Z = X.assign(RecordID=[f"r{i % 30}" for i in range(150)])
+            save_cache(
+                {"Z": Z},
+                cache_path,
+                cache_format,
+                partition_key="RecordID",
+                partition_rows=20,
+            )
+            pd.testing.assert_frame_equal(load_cache(cache_path, cache_format)["Z"], Z)
+            loaded = load_cache(
+                cache_path, cache_format, entities=["r1", "r17"], columns=["a"]
+            )
+            expected = Z.loc[Z["RecordID"].isin(["r1", "r17"]), ["a"]]
+            pd.testing.assert_frame_equal(loaded["Z"], expected)
+        tsdb.purge_path(saving_dir)
+
+        with temporary_tsdb_home() as tsdb_home:
+            make_fake_physionet2019(tsdb_home)
+            data = tsdb.load("physionet_2019")
+            partitions = tsdb.list_partitions("physionet_2019")
+            assert sum(p["num_rows"] for p in partitions["training_setB"]) == 30
+            subset = tsdb.load("physionet_2019", entities=["pa1", "pb2"])
+            assert sorted(subset["training_setA"]["RecordID"].unique()) == ["pa1"]
+            assert len(subset["training_setB"]) == 5
+            assert len(subset["training_setA"]) + len(data["training_setB"]) == 35
+
+    def test_14_dtype_policy(self):
+        with temporary_tsdb_home() as tsdb_home:
+            make_fake_ett(tsdb_home)
+            data = tsdb.load("electricity_transformer_temperature")
+            compact = tsdb.load(
+                "electricity_transformer_temperature", dtype_policy="compact"
+            )
+            assert (data["ETTh1"].dtypes == np.float64).all()
+            assert (compact["ETTh1"].dtypes == np.float32).all()
+            # each policy has its own cache, saved in its dtypes
+            compact = tsdb.load(
+                "electricity_transformer_temperature", dtype_policy="compact"
+            )
+            assert (compact["ETTh1"].dtypes == np.float32).all()
+            caches = tsdb.list_cache(detailed=True)[0]["caches"]
+            assert sorted(c["dtype_policy"] for c in caches) == ["compact", "default"]
+
+            make_fake_physionet2019(tsdb_home)
+            compact = tsdb.load("physionet_2019", dtype_policy="compact")
+            assert compact["training_setA"]["HR"].dtype == np.float32
+            assert compact["training_setA"]["SepsisLabel"].dtype == "Int8"
+            assert isinstance(
+                compact["training_setA"]["RecordID"].dtype, pd.CategoricalDtype
+            )
+            subset = tsdb.load(
+                "physionet_2019", dtype_policy="compact", entities=["pa1"]
+            )
+            assert subset["training_setA"]["RecordID"].astype(
+                str
+            ).unique().tolist() == ["pa1"]
+
+            (y_train, y_test), y_classes = encode_labels(
+                np.array(["b", "a", "b"]), np.array(["c", "a"])
+            )
+            assert y_train.dtype == np.int8 and y_classes.tolist() == ["a", "b", "c"]
+            assert y_classes[y_test].tolist() == ["c", "a"]
+
+    def test_15_parallel_downloads(self):
+        served_dir, saving_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        server, base_url = serve_directory(served_dir)
+        try:
+            for i in range(3):
+                with open(os.path.join(served_dir, f"part{i}.csv"), "w") as f:
+                    f.write(f"a,b\n{i},{i}\n")
+            DATABASE["test_links"] = [f"{base_url}/part{i}.csv" for i in range(3)]
+            dataset_saving_path = os.path.join(saving_dir, "test_links")
+            tsdb.download_and_extract("test_links", dataset_saving_path)
+            assert sorted(os.listdir(dataset_saving_path)) == [
+                downloading.MANIFEST_NAME,
+                "part0.csv",
+                "part1.csv",
+                "part2.csv",
+            ]
+            # no lock files or staging dirs are left next to the given path
+            assert os.listdir(saving_dir) == ["test_links"]
+
+            # one failed link fails the whole dataset
+            DATABASE["test_links"].append(f"{base_url}/missing.csv")
+            tsdb.purge_path(dataset_saving_path)
+            with self.assertRaises(RuntimeError):
+                tsdb.download_and_extract("test_links", dataset_saving_path)
+            assert not os.path.exists(dataset_saving_path)
+        finally:
+            DATABASE.pop("test_links", None)
+            server.shutdown()
+            tsdb.purge_path(served_dir)
+            tsdb.purge_path(saving_dir)
+
+    def test_16_resumable_downloads(self):
+        served_dir, saving_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        content = os.urandom(1 << 20)
+        with open(os.path.join(served_dir, "big.csv"), "wb") as f:
+            f.write(content)
+        dataset_saving_path = os.path.join(saving_dir, "big")
+        partial_path = os.path.join(
+            downloading._get_staging_dir(dataset_saving_path), "big.csv"
+        )
+        for handler_class in [
+            RangeRequestHandler,
+            MisalignedRangeRequestHandler,
+            QuietRequestHandler,
+        ]:
+            server, base_url = serve_directory(served_dir, handler_class)
+            try:
+                # an interrupted download leaves the first part of the file and its journal
+                os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+                with open(partial_path, "wb") as f:
+                    f.write(content[:300000])
+                with open(partial_path + downloading.JOURNAL_SUFFIX, "w") as f:
+                    json.dump(
+                        {
+                            "url": f"{base_url}/big.csv",
+                            "expected_length": len(content),
+                            "etag": None,
+                            "last_modified": "Thu, 01 Jan 2026 00:00:00 GMT",
+                        },
+                        f,
+                    )
+                RangeRequestHandler.range_requests.clear()
+                downloading._download_and_extract(
+                    f"{base_url}/big.csv", dataset_saving_path
+                )
+                with open(os.path.join(dataset_saving_path, "big.csv"), "rb") as f:
+                    assert f.read() == content
+                # servers without range support send the full file, which is downloaded from the start,
+                # and so is the file whose range sent does not follow the partial file
+                expected = (
+                    [] if handler_class is QuietRequestHandler else ["bytes=300000-"]
+                )
+                assert RangeRequestHandler.range_requests == expected
+                assert not os.path.exists(partial_path + downloading.JOURNAL_SUFFIX)
+            finally:
+                server.shutdown()
+        tsdb.purge_path(served_dir)
+        tsdb.purge_path(saving_dir)
+
+    def test_17_segmented_downloads(self):
+        served_dir, saving_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        content = os.urandom(1 << 20)
+        with open(os.path.join(served_dir, "big.zip"), "wb") as f:
+            f.write(content)
+        server, base_url = serve_directory(served_dir, RangeRequestHandler)
+        file_path = os.path.join(saving_dir, "big.zip")
+        try:
+            with override_configs(
+                {"download": {"segment_connections": "4", "segment_size": "100000"}}
+            ):
+                RangeRequestHandler.range_requests.clear()
+                downloading._download_file(f"{base_url}/big.zip", file_path)
+                with open(file_path, "rb") as f:
+                    assert f.read() == content
+                # a probe for range support, then 11 segments
+                assert len(RangeRequestHandler.range_requests) == 12
+
+                # a retry only fetches the segments missing from the journal
+                journal_path = file_path + downloading.JOURNAL_SUFFIX
+                with open(journal_path, "r") as f:
+                    journal = json.load(f)
+                journal["completed_segments"] = [0, 1, 2, 3, 4]
+                with open(journal_path, "w") as f:
+                    json.dump(journal, f)
+                with open(file_path, "r+b") as f:
+                    f.seek(500000)
+                    f.write(bytes(len(content) - 500000))
+                RangeRequestHandler.range_requests.clear()
+                downloading._download_file(f"{base_url}/big.zip", file_path)
+                with open(file_path, "rb") as f:
+                    assert f.read() == content
+                assert len(RangeRequestHandler.range_requests) == 6
+        finally:
+            server.shutdown()
+            tsdb.purge_path(served_dir)
+            tsdb.purge_path(saving_dir)
+
+    def test_18_download_session(self):
+        served_dir, saving_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        with open(os.path.join(served_dir, "data.csv"), "w") as f:
+            f.write("a,b\n1,2\n")
+        server, base_url = serve_directory(served_dir, FlakyRequestHandler)
+        dataset_saving_path = os.path.join(saving_dir, "flaky")
+        downloading._session = None
+        try:
+            with override_configs({"download": {"backoff_factor": "0.01"}}):
+                session = downloading.get_session()
+                assert downloading.get_session() is session
+                # transient server errors are retried
+                FlakyRequestHandler.failures_left = 2
+                downloading._download_and_extract(
+                    f"{base_url}/data.csv", dataset_saving_path
+                )
+                assert os.path.exists(os.path.join(dataset_saving_path, "data.csv"))
+                # and the error is raised once the retries are exhausted
+                FlakyRequestHandler.failures_left = 100
+                with self.assertRaises(RuntimeError):
+                    downloading._download_and_extract(
+                        f"{base_url}/data.csv", dataset_saving_path
+                    )
+        finally:
+            downloading._session = None
+            server.shutdown()
+            tsdb.purge_path(served_dir)
+            tsdb.purge_path(saving_dir)
+
+    def test_19_streaming_extraction(self):
+        served_dir, saving_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        archive_path = os.path.join(served_dir, "records.tar.gz")
+        with tarfile.open(archive_path, "w:gz") as tar:
+            for i in range(3):
+                content = f"Time,Value\n{i},{i * 0.5}\n".encode()
+                info = tarfile.TarInfo(f"set-a/{i}.txt")
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        server, base_url = serve_directory(served_dir)
+        dataset_saving_path = os.path.join(saving_dir, "records")
+        try:
+            downloading._download_and_extract(
+                f"{base_url}/records.tar.gz", dataset_saving_path
+            )
+            assert sorted(os.listdir(os.path.join(dataset_saving_path, "set-a"))) == [
+                "0.txt",
+                "1.txt",
+                "2.txt",
+            ]
+            # the archive is never written into the staging dir
+            assert os.listdir(os.path.join(saving_dir, ".partial", "records")) == []
+            # extracting again replaces the previous files
+            downloading._download_and_extract(
+                f"{base_url}/records.tar.gz", dataset_saving_path
+            )
+            assert len(os.listdir(os.path.join(dataset_saving_path, "set-a"))) == 3
+        finally:
+            server.shutdown()
+            tsdb.purge_path(served_dir)
+            tsdb.purge_path(saving_dir)
+
+    def test_20_streaming_gzip(self):
+        served_dir, saving_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        # 32 MB of highly compressible rows, a few hundred KB compressed
+        line = ",".join(["0.5"] * 63) + "\n"
+        n_lines = 32 * 1024 * 1024 // len(line)
+        with gzip.open(os.path.join(served_dir, "traffic.txt.gz"), "wt") as f:
+            for _ in range(n_lines // 1024):
+                f.write(line * 1024)
+        server, base_url = serve_directory(served_dir)
+        try:
+            for stream_extraction in ["true", "false"]:
+                with override_configs(
+                    {"download": {"stream_extraction": stream_extraction}}
+                ):
+                    dataset_saving_path = os.path.join(saving_dir, stream_extraction)
+                    tracemalloc.start()
+                    downloading._download_and_extract(
+                        f"{base_url}/traffic.txt.gz", dataset_saving_path
+                    )
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    file_path = os.path.join(dataset_saving_path, "traffic.txt")
+                    assert os.path.getsize(file_path) == n_lines // 1024 * 1024 * len(
+                        line
+                    )
+                    # neither the compressed nor the decompressed file is held in memory
+                    assert peak < 4 * 1024 * 1024, peak
+        finally:
+            server.shutdown()
+            tsdb.purge_path(served_dir)
+            tsdb.purge_path(saving_dir)
+
+    def test_21_download_verification(self):
+        served_dir, saving_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        contents = {f"part{i}.csv": f"a,b\n{i},{i}\n".encode() for i in range(3)}
+        for file_name, content in contents.items():
+            with open(os.path.join(served_dir, file_name), "wb") as f:
+                f.write(content)
+        server, base_url = serve_directory(served_dir, RecordingRequestHandler)
+        dataset_saving_path = os.path.join(saving_dir, "test_links")
+        links = [f"{base_url}/{file_name}" for file_name in contents]
+        DATABASE["test_links"] = links
+        for link, content in zip(links, contents.values()):
+            CHECKSUMS[link] = {
+                "size": len(content),
+                "sha256": hashlib.sha256(content).hexdigest(),
+            }
+        try:
+            tsdb.download_and_extract("test_links", dataset_saving_path)
+            manifest = downloading.read_manifest(dataset_saving_path)
+            assert manifest[links[1]]["sha256"] == CHECKSUMS[links[1]]["sha256"]
+            assert manifest[links[1]]["outputs"] == ["part1.csv"]
+            assert downloading.verify_download("test_links", dataset_saving_path) == []
+
+            # only the missing file is re-fetched
+            os.remove(os.path.join(dataset_saving_path, "part1.csv"))
+            assert downloading.verify_download("test_links", dataset_saving_path) == [
+                links[1]
+            ]
+            RecordingRequestHandler.requested_paths.clear()
+            tsdb.download_and_extract("test_links", dataset_saving_path)
+            assert RecordingRequestHandler.requested_paths == ["/part1.csv"]
+
+            # a download mismatching the expected digest fails and is not kept for resuming
+            CHECKSUMS[links[2]]["sha256"] = "0" * 64
+            assert downloading.verify_download("test_links", dataset_saving_path) == [
+                links[2]
+            ]
+            with self.assertRaises(RuntimeError):
+                tsdb.download_and_extract("test_links", dataset_saving_path)
+            # the verified files are kept
+            assert os.path.exists(os.path.join(dataset_saving_path, "part0.csv"))
+            staging_dir = downloading._get_staging_dir(dataset_saving_path)
+            assert not os.path.exists(os.path.join(staging_dir, "part2.csv"))
+        finally:
+            DATABASE.pop("test_links", None)
+            for link in links:
+                CHECKSUMS.pop(link, None)
+            server.shutdown()
+            tsdb.purge_path(served_dir)
+            tsdb.purge_path(saving_dir)
+
+    def test_22_mirrors(self):
+        mirror_dir, flat_dir, saving_dir = (tempfile.mkdtemp() for _ in range(3))
+        # the original server is never reached
+        links = [
+            "https://example.org/data/part0.csv",
+            "https://example.org/data/records.tar.gz",
+        ]
+        # a mirror holding files under the host and path of their links
+        os.makedirs(os.path.join(mirror_dir, "example.org", "data"))
+        with open(
+            os.path.join(mirror_dir, "example.org", "data", "part0.csv"), "w"
+        ) as f:
+            f.write("a,b\n0,0\n")
+        with tarfile.open(
+            os.path.join(mirror_dir, "example.org", "data", "records.tar.gz"), "w:gz"
+        ) as tar:
+            tar.add(
+                os.path.join(mirror_dir, "example.org", "data", "part0.csv"),
+                arcname="set-a/0.txt",
+            )
+        # a mirror holding files directly by their names
+        for file_name in ["part0.csv", "records.tar.gz"]:
+            os.link(
+                os.path.join(mirror_dir, "example.org", "data", file_name),
+                os.path.join(flat_dir, file_name),
+            )
+        server, base_url = serve_directory(flat_dir, RecordingRequestHandler)
+        DATABASE["test_links"] = links
+        try:
+            for mirrors, mirror_selection in [
+                (f"/nonexistent, {mirror_dir}", "order"),
+                (f"file://{flat_dir}", "order"),
+                (f"{base_url}/missing, {base_url}", "latency"),
+            ]:
+                with override_configs(
+                    {
+                        "download": {
+                            "mirrors": mirrors,
+                            "mirror_selection": mirror_selection,
+                        }
+                    }
+                ):
+                    RecordingRequestHandler.requested_paths.clear()
+                    dataset_saving_path = os.path.join(saving_dir, "test_links")
+                    tsdb.download_and_extract("test_links", dataset_saving_path)
+                    assert os.path.exists(
+                        os.path.join(dataset_saving_path, "set-a", "0.txt")
+                    )
+                    file_stat = os.stat(os.path.join(dataset_saving_path, "part0.csv"))
+                    if mirrors.startswith("http"):
+                        assert (
+                            "/records.tar.gz" in RecordingRequestHandler.requested_paths
+                        )
+                    else:
+                        # files in local mirrors are hard linked rather than copied
+                        assert file_stat.st_nlink > 1
+                        assert RecordingRequestHandler.requested_paths == []
+                    tsdb.purge_path(dataset_saving_path)
+        finally:
+            DATABASE.pop("test_links", None)
+            server.shutdown()
+            for path in [mirror_dir, flat_dir, saving_dir]:
+                tsdb.purge_path(path)
+
+    def test_23_prefetch(self):
+        with temporary_tsdb_home() as tsdb_home:
+            served_dir = tempfile.mkdtemp()
+            with zipfile.ZipFile(os.path.join(served_dir, "Wine.zip"), "w") as f:
+                f.writestr("Wine_TRAIN.txt", "1,0.1,0.2\n")
+                f.writestr("Wine_TEST.txt", "2,0.3,0.4\n")
+            zip_size = os.path.getsize(os.path.join(served_dir, "Wine.zip"))
+            server, base_url = serve_directory(served_dir)
+            links = {name: DATABASE[name] for name in ["ucr_uea_Wine", "ucr_uea_Beef"]}
+            DATABASE["ucr_uea_Wine"] = f"{base_url}/Wine.zip"
+            DATABASE["ucr_uea_Beef"] = f"{base_url}/missing.zip"
+            try:
+                make_fake_ett(tsdb_home)
+                report = tsdb.prefetch(
+                    ["electricity_transformer_temperature", "ucr_uea_Beef"],
+                    max_workers=2,
+                    cache_format="parquet",
+                )
+                assert list(report) == [
+                    "electricity_transformer_temperature",
+                    "ucr_uea_Beef",
+                ]
+                assert report["electricity_transformer_temperature"]["success"]
+                assert report["electricity_transformer_temperature"]["error"] is None
+                # the failed dataset does not stop the others
+                assert not report["ucr_uea_Beef"]["success"]
+                assert "404" in report["ucr_uea_Beef"]["error"]
+                # the cache is built, so loading does not parse again
+                stage_state = data_processing._read_stage_state(
+                    os.path.join(
+                        tsdb_home,
+                        "electricity_transformer_temperature",
+                    )
+                )
+                assert "parquet" in stage_state["caches"]
+
+                # sizes are known before downloading
+                assert downloading.get_download_size("ucr_uea_Wine") == zip_size
+                report = tsdb.prefetch(["ucr_uea_Wine"], parse=False)
+                assert report["ucr_uea_Wine"]["success"]
+                assert report["ucr_uea_Wine"]["bytes"] == zip_size
+                assert os.path.exists(
+                    os.path.join(tsdb_home, "ucr_uea_Wine", "Wine_TRAIN.txt")
+                )
+
+                # interrupting aborts the running downloads instead of waiting for them, which would take 10 seconds
+                with open(os.path.join(served_dir, "Beef.zip"), "wb") as f:
+                    f.write(os.urandom(1 << 20))
+                slow_server, slow_base_url = serve_directory(
+                    served_dir, SlowRequestHandler
+                )
+                DATABASE["ucr_uea_Beef"] = f"{slow_base_url}/Beef.zip"
+                threading.Timer(1, os.kill, [os.getpid(), signal.SIGINT]).start()
+                start_time = time.time()
+                try:
+                    with self.assertRaises(KeyboardInterrupt):
+                        tsdb.prefetch(["ucr_uea_Beef"], parse=False)
+                    assert time.time() - start_time < 5
+                    beef_dir = os.path.join(tsdb_home, "ucr_uea_Beef")
+                    while os.path.exists(beef_dir) and time.time() - start_time < 5:
+                        time.sleep(0.1)
+                    # the aborted download is cleaned up
+                    assert not os.path.exists(beef_dir)
+                finally:
+                    slow_server.shutdown()
+            finally:
+                DATABASE.update(links)
+                server.shutdown()
+                tsdb.purge_path(served_dir)
+
+    def test_24_selective_extraction(self):
+        served_dir, saving_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        members = [
+            f"Wine_{split}.{ext}"
+            for ext in ["arff", "txt", "ts"]
+            for split in ["TRAIN", "TEST"]
+        ]
+        with zipfile.ZipFile(os.path.join(served_dir, "Wine.zip"), "w") as f:
+            for member in members:
+                f.writestr(member, "0")
+        server, base_url = serve_directory(served_dir)
+        link = DATABASE["ucr_uea_Wine"]
+        DATABASE["ucr_uea_Wine"] = f"{base_url}/Wine.zip"
+        dataset_saving_path = os.path.join(saving_dir, "ucr_uea_Wine")
+        try:
+            # only the files read by the loading function are extracted
+            tsdb.download_and_extract(
+                "ucr_uea_Wine",
+                dataset_saving_path,
+                data_processing._get_member_selector("ucr_uea_Wine"),
+            )
+            assert sorted(
+                f for f in os.listdir(dataset_saving_path) if not f.startswith(".")
+            ) == ["Wine_TEST.arff", "Wine_TRAIN.arff"]
+            # TXT files are selected if ARFF ones are not both provided, otherwise everything is extracted
+            assert tsdb.loading_funcs.select_ucr_uea_members(members[1:], "Wine") == [
+                "Wine_TRAIN.txt",
+                "Wine_TEST.txt",
+            ]
+            assert (
+                tsdb.loading_funcs.select_ucr_uea_members(members[4:], "Wine") is None
+            )
+
+            # asking for the raw data extracts all members
+            tsdb.download_and_extract("ucr_uea_Wine", dataset_saving_path)
+            assert sorted(
+                f for f in os.listdir(dataset_saving_path) if not f.startswith(".")
+            ) == sorted(members)
+        finally:
+            DATABASE["ucr_uea_Wine"] = link
+            server.shutdown()
+            tsdb.purge_path(served_dir)
+            tsdb.purge_path(saving_dir)
+
+    def test_25_blob_store(self):
+        with temporary_tsdb_home() as tsdb_home:
+            served_dir = tempfile.mkdtemp()
+            with open(os.path.join(served_dir, "part0.csv"), "w") as f:
+                f.write("a,b\n0,0\n")
+            os.link(
+                os.path.join(served_dir, "part0.csv"),
+                os.path.join(served_dir, "copy.csv"),
+            )
+            with tarfile.open(
+                os.path.join(served_dir, "records.tar.gz"), "w:gz"
+            ) as tar:
+                tar.add(os.path.join(served_dir, "part0.csv"), arcname="set-a/0.txt")
+            server, base_url = serve_directory(served_dir)
+            DATABASE["test_links"] = [
+                f"{base_url}/part0.csv",
+                f"{base_url}/records.tar.gz",
+            ]
+            DATABASE["test_copy"] = f"{base_url}/copy.csv"
+            dataset_saving_path = os.path.join(tsdb_home, "test_links")
+            blob_store_dir = blob_store.get_blob_store_dir(dataset_saving_path)
+            try:
+                tsdb.download_and_extract(
+                    "test_links", dataset_saving_path, use_blob_store=True
+                )
+                tsdb.download_and_extract(
+                    "test_copy",
+                    os.path.join(tsdb_home, "test_copy"),
+                    use_blob_store=True,
+                )
+                blobs = [f for _, _, files in os.walk(blob_store_dir) for f in files]
+                # identical files are stored once, and plain files are hard linked into dataset dirs
+                assert len(blobs) == 3  # the csv, the tarball, and the index
+                csv_stat = os.stat(os.path.join(dataset_saving_path, "part0.csv"))
+                assert csv_stat.st_nlink == 3
+
+                # the dataset dir is re-created without network
+                server.shutdown()
+                tsdb.purge_path(dataset_saving_path)
+                tsdb.download_and_extract(
+                    "test_links", dataset_saving_path, use_blob_store=True
+                )
+                assert os.path.exists(
+                    os.path.join(dataset_saving_path, "set-a", "0.txt")
+                )
+                assert os.path.exists(os.path.join(dataset_saving_path, "part0.csv"))
+
+                # only the tarball is evictable, the csv is linked into dataset dirs
+                tarball_size = os.path.getsize(
+                    os.path.join(served_dir, "records.tar.gz")
+                )
+                assert blob_store.evict_blobs(blob_store_dir, 1 << 30) == tarball_size
+                assert blob_store.find_blob(blob_store_dir, f"{base_url}/part0.csv")
+                assert not blob_store.find_blob(
+                    blob_store_dir, f"{base_url}/records.tar.gz"
+                )
+
+                # deleting files linked from the store frees no space until their blobs are evicted too
+                csv_size = os.path.getsize(
+                    os.path.join(dataset_saving_path, "part0.csv")
+                )
+                assert (
+                    get_freeable_size(dataset_saving_path)
+                    == get_size(dataset_saving_path) - csv_size
+                )
+                tsdb.purge_path(os.path.join(tsdb_home, "test_copy"))
+                with override_configs({"cache": {"max_disk_bytes": "1"}}):
+                    data_processing._enforce_disk_quota("another_dataset")
+                assert os.listdir(tsdb_home) == [blob_store.BLOB_STORE_DIR_NAME]
+                assert not blob_store.find_blob(blob_store_dir, f"{base_url}/part0.csv")
+            finally:
+                DATABASE.pop("test_links", None)
+                DATABASE.pop("test_copy", None)
+                server.shutdown()
+                tsdb.purge_path(served_dir)
+
+    def test_26_conditional_refresh(self):
+        served_dir, saving_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        for i in range(2):
+            with open(os.path.join(served_dir, f"part{i}.csv"), "w") as f:
+                f.write(f"a,b\n{i},{i}\n")
+        server, base_url = serve_directory(served_dir, RecordingRequestHandler)
+        DATABASE["test_links"] = [f"{base_url}/part{i}.csv" for i in range(2)]
+        dataset_saving_path = os.path.join(saving_dir, "test_links")
+        try:
+            tsdb.download_and_extract("test_links", dataset_saving_path)
+            manifest = downloading.read_manifest(dataset_saving_path)
+            assert manifest[f"{base_url}/part0.csv"]["last_modified"] is not None
+
+            # files restored from the blob store keep their validators for refreshing
+            blob_saving_path = os.path.join(saving_dir, "test_blobs")
+            tsdb.download_and_extract(
+                "test_links", blob_saving_path, use_blob_store=True
+            )
+            tsdb.purge_path(blob_saving_path)
+            tsdb.download_and_extract(
+                "test_links", blob_saving_path, use_blob_store=True
+            )
+            assert downloading.read_manifest(blob_saving_path) == manifest
+
+            # files not modified on the server are answered with 304 and kept
+            RecordingRequestHandler.requested_paths.clear()
+            tsdb.download_and_extract("test_links", dataset_saving_path, refresh=True)
+            assert sorted(RecordingRequestHandler.requested_paths) == [
+                "/part0.csv",
+                "/part1.csv",
+            ]
+
+            # modified ones are downloaded again
+            with open(os.path.join(served_dir, "part1.csv"), "w") as f:
+                f.write("a,b\n2,2\n")
+            modified_time = os.path.getmtime(os.path.join(served_dir, "part1.csv"))
+            os.utime(
+                os.path.join(served_dir, "part1.csv"),
+                (modified_time + 10, modified_time + 10),
+            )
+            # modified ones are downloaded again, in the same request
+            RecordingRequestHandler.requested_paths.clear()
+            tsdb.download_and_extract("test_links", dataset_saving_path, refresh=True)
+            assert sorted(RecordingRequestHandler.requested_paths) == [
+                "/part0.csv",
+                "/part1.csv",
+            ]
+            with open(os.path.join(dataset_saving_path, "part1.csv")) as f:
+                assert f.read() == "a,b\n2,2\n"
+
+            # files failing to be refreshed, e.g. answered with 404, are kept
+            for i in range(2):
+                os.remove(os.path.join(served_dir, f"part{i}.csv"))
+            tsdb.download_and_extract("test_links", dataset_saving_path, refresh=True)
+            assert downloading.verify_download("test_links", dataset_saving_path) == []
+            with open(os.path.join(dataset_saving_path, "part1.csv")) as f:
+                assert f.read() == "a,b\n2,2\n"
+        finally:
+            DATABASE.pop("test_links", None)
+            server.shutdown()
+            tsdb.purge_path(served_dir)
+            tsdb.purge_path(saving_dir)
+
+    def test_27_refreshing_load(self):
+        with temporary_tsdb_home() as tsdb_home:
+            served_root = tempfile.mkdtemp()
+            served_dir = make_fake_ett(served_root)
+            server, base_url = serve_directory(served_dir)
+            dataset_name = "electricity_transformer_temperature"
+            links = DATABASE[dataset_name]
+            DATABASE[dataset_name] = [
+                f"{base_url}/{os.path.basename(link)}" for link in links
+            ]
+            dataset_dir = os.path.join(tsdb_home, dataset_name)
+            cache_path = get_cache_path(dataset_dir, dataset_name, "pickle")
+            try:
+                data = tsdb.load(dataset_name)
+                # files not modified on the server are kept, and the cache is rebuilt from them
+                tsdb.load(dataset_name, use_cache=False)
+                assert os.path.exists(cache_path)
+
+                # the cache is kept if re-fetching the missing files fails
+                os.remove(os.path.join(dataset_dir, "ETTh1.csv"))
+                os.remove(os.path.join(served_dir, "ETTh1.csv"))
+                with self.assertRaises(RuntimeError):
+                    tsdb.load(dataset_name, use_cache=False)
+                assert os.path.exists(cache_path)
+                pd.testing.assert_frame_equal(
+                    tsdb.load(dataset_name)["ETTh1"], data["ETTh1"]
+                )
+            finally:
+                DATABASE[dataset_name] = links
+                server.shutdown()
+                tsdb.purge_path(served_root)
+
 
 if __name__ == "__main__":
     unittest.main()
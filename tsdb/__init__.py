@@ -12,7 +12,10 @@ from .data_processing import (
     load,
     download_and_extract,
     list_cache,
+    list_partitions,
     delete_cache,
+    prefetch,
+    publish,
 )
 from .utils.file import (
     purge_path,
@@ -21,16 +24,32 @@ from .utils.file import (
     migrate,
     migrate_cache,
 )
+from .utils.memory_cache import (
+    memory_cache_info,
+    clear_memory_cache,
+    set_memory_cache_max_bytes,
+)
+from .utils.shared_memory import SharedDataset, attach
 from .version import __version__
 
 __all__ = [
     "__version__",
     "list",
     "load",
+    "prefetch",
     "download_and_extract",
     "list_cache",
+    "list_partitions",
     "delete_cache",
     "CACHED_DATASET_DIR",
+    # memory cache
+    "memory_cache_info",
+    "clear_memory_cache",
+    "set_memory_cache_max_bytes",
+    # shared memory
+    "publish",
+    "attach",
+    "SharedDataset",
     # file
     "purge_path",
     "pickle_dump",
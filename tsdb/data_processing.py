@@ -5,11 +5,23 @@ Functions for loading datasets.
 # Created by Wenjie Du <wenjay.du@gmail.com>
 # License: BSD-3-Clause
 
+import hashlib
+import inspect
+import json
 import os
 import shutil
+import sys
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from copy import deepcopy
+from functools import partial
+from typing import Callable, Optional, Tuple, Union
 
-from .database import AVAILABLE_DATASETS
+from tqdm import tqdm
+
+from .database import AVAILABLE_DATASETS, DATABASE
 from .loading_funcs import (
     load_physionet2012,
     load_physionet2019,
@@ -17,18 +29,492 @@ from .loading_funcs import (
     load_ett,
     load_beijing_air_quality,
     load_ucr_uea_dataset,
+    select_ucr_uea_members,
     load_ais,
     load_italy_air_quality,
     load_pems_traffic,
     load_solar_alabama,
 )
-from .utils.downloading import download_and_extract
-from .utils.file import purge_path, pickle_load, pickle_dump, determine_tsdb_home
+from .utils.blob_store import BLOB_STORE_DIR_NAME, evict_blobs
+from .utils.cache import (
+    CACHE_FORMATS,
+    COMPRESSIONS,
+    LazyDataset,
+    get_cache_path,
+    is_cache_path,
+    cache_exists,
+    save_cache,
+    load_cache,
+    read_partition_index,
+)
+from .utils.config import get_config
+from .utils.downloading import (
+    download_and_extract,
+    get_download_size,
+    quiet_file_progress,
+    read_manifest,
+    verify_download,
+)
+from .utils.dtypes import DTYPE_POLICIES, apply_dtype_policy
+from .utils.executor import shutdown_executor
+from .utils.file import (
+    purge_path,
+    determine_tsdb_home,
+    get_size,
+    get_freeable_size,
+)
+from .utils.locking import FileLock, get_lock_path
+from .utils.memory_cache import MEMORY_CACHE, estimate_nbytes
+from .utils.shared_memory import SharedDataset, publish_dataset
 from .utils.logging import logger
+from .version import __version__
 
 CACHED_DATASET_DIR = determine_tsdb_home()
 
 
+_LOADING_FUNCS = {
+    "physionet_2012": load_physionet2012,
+    "physionet_2019": load_physionet2019,
+    "electricity_load_diagrams": load_electricity,
+    "electricity_transformer_temperature": load_ett,
+    "beijing_multisite_air_quality": load_beijing_air_quality,
+    "italy_air_quality": load_italy_air_quality,
+    "vessel_ais": load_ais,
+    "pems_traffic": load_pems_traffic,
+    "solar_alabama": load_solar_alabama,
+}
+# columns identifying entities in large multi-entity datasets, by which their parquet/feather caches are partitioned
+_PARTITION_KEYS = {
+    "physionet_2012": "RecordID",
+    "physionet_2019": "RecordID",
+    "vessel_ais": "mmsi",
+}
+STAGE_STATE_NAME = ".tsdb_stages.json"
+
+
+def _get_loading_func(dataset_name: str) -> Callable[[str], dict]:
+    if "ucr_uea_" in dataset_name:
+        actual_dataset_name = dataset_name.replace(
+            "ucr_uea_", ""
+        )  # delete 'ucr_uea_' in the name
+        return partial(load_ucr_uea_dataset, dataset_name=actual_dataset_name)
+    if dataset_name not in _LOADING_FUNCS:
+        raise NotImplementedError(
+            f"Dataset {dataset_name} is not supported yet. "
+            f"Please check the dataset name or contribute it to TSDB https://github.com/WenjieDu/TSDB/."
+        )
+    return _LOADING_FUNCS[dataset_name]
+
+
+def _get_member_selector(dataset_name: str) -> Optional[Callable[[list], list]]:
+    # only the archive members read by the loading function are extracted when loading,
+    # download_and_extract() called by users for the raw data extracts everything
+    if "ucr_uea_" in dataset_name:
+        return partial(
+            select_ucr_uea_members, dataset_name=dataset_name.replace("ucr_uea_", "")
+        )
+    return None
+
+
+def _fingerprint(*parts: str) -> str:
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _get_download_fingerprint(dataset_name: str) -> str:
+    links = DATABASE[dataset_name]
+    links = [links] if isinstance(links, str) else links
+    return _fingerprint(*links)
+
+
+def _get_parse_fingerprint(dataset_name: str, download_fingerprint: str) -> str:
+    # the whole module source of the loading function is hashed to cover the helper functions it calls
+    loading_func = _get_loading_func(dataset_name)
+    loading_func = getattr(loading_func, "func", loading_func)
+    try:
+        source = inspect.getsource(sys.modules[loading_func.__module__])
+    except (OSError, TypeError):
+        source = loading_func.__qualname__
+    return _fingerprint(download_fingerprint, source, __version__)
+
+
+def _read_stage_state(dataset_saving_path: str) -> dict:
+    """Read fingerprints of the finished stages of the dataset.
+    The download stage fingerprint covers the download links in the database, and every cache is stamped with the
+    parse stage fingerprint covering the download fingerprint, the loading function's source, and the TSDB version.
+    Caches also record their compression, the in-memory size of the dataset, and the last full decoding time.
+    The download fingerprint is None if the raw data has not been downloaded or has been evicted.
+    """
+    if not os.path.exists(dataset_saving_path):
+        return {"download": None, "caches": {}}
+
+    state_path = os.path.join(dataset_saving_path, STAGE_STATE_NAME)
+    if os.path.exists(state_path):
+        with open(state_path, "r") as f:
+            stage_state = json.load(f)
+        stage_state.setdefault("last_access", os.path.getmtime(state_path))
+        return stage_state
+
+    # the dataset dir was made by an older TSDB without stage fingerprints,
+    # trust its raw data but not its caches that may be generated by an old pipeline
+    dataset_name = os.path.basename(dataset_saving_path)
+    return {
+        "download": (
+            _get_download_fingerprint(dataset_name)
+            if dataset_name in DATABASE
+            else None
+        ),
+        "caches": {},
+        "last_access": os.path.getmtime(dataset_saving_path),
+    }
+
+
+def _write_stage_state(dataset_saving_path: str, stage_state: dict) -> None:
+    state_path = os.path.join(dataset_saving_path, STAGE_STATE_NAME)
+    tmp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(stage_state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def _get_cache_key(cache_format: str, dtype_policy: str) -> str:
+    # caches of non-default dtype policies are recorded in the stage state as e.g. "parquet/compact"
+    return (
+        cache_format if dtype_policy == "default" else f"{cache_format}/{dtype_policy}"
+    )
+
+
+def _is_cache_fresh(stage_state: dict, cache_key: str, parse_fingerprint: str) -> bool:
+    cache_info = stage_state["caches"].get(cache_key, {})
+    return cache_info.get("fingerprint") == parse_fingerprint
+
+
+def _purge_stale_caches(
+    dataset_saving_path: str,
+    dataset_name: str,
+    stage_state: dict,
+    parse_fingerprint: str,
+) -> None:
+    for cache_format in CACHE_FORMATS:
+        for dtype_policy in DTYPE_POLICIES:
+            cache_key = _get_cache_key(cache_format, dtype_policy)
+            if _is_cache_fresh(stage_state, cache_key, parse_fingerprint):
+                continue
+            stage_state["caches"].pop(cache_key, None)
+            cache_path = get_cache_path(
+                dataset_saving_path, dataset_name, cache_format, dtype_policy
+            )
+            if os.path.exists(cache_path):
+                logger.info(f"Purging stale cache {cache_path}...")
+                purge_path(cache_path)
+
+
+def _load_other_fresh_cache(
+    dataset_saving_path: str,
+    dataset_name: str,
+    stage_state: dict,
+    parse_fingerprint: str,
+    cache_format: str,
+    dtype_policy: str,
+) -> Optional[dict]:
+    """Load a fresh cache of the dataset in a format other than the given one, e.g. the pickle cache when a columnar
+    one is needed for pushdown, to build the cache in the given format from. Returns None if there is none.
+    """
+    for other_format in CACHE_FORMATS:
+        if other_format == cache_format or not _is_cache_fresh(
+            stage_state, _get_cache_key(other_format, dtype_policy), parse_fingerprint
+        ):
+            continue
+        other_path = get_cache_path(
+            dataset_saving_path, dataset_name, other_format, dtype_policy
+        )
+        if cache_exists(other_path, other_format):
+            result = load_cache(other_path, other_format)
+            if result is not None:
+                logger.info(
+                    f"Building the {cache_format} cache of dataset {dataset_name} from its {other_format} cache..."
+                )
+                return result
+    return None
+
+
+def _record_decode_seconds(
+    dataset_saving_path: str, cache_key: str, decode_seconds: float
+) -> None:
+    with FileLock(get_lock_path(dataset_saving_path)):
+        stage_state = _read_stage_state(dataset_saving_path)
+        if cache_key in stage_state["caches"]:
+            stage_state["caches"][cache_key]["decode_seconds"] = decode_seconds
+            _write_stage_state(dataset_saving_path, stage_state)
+
+
+def _run_download_stage(
+    dataset_name: str,
+    dataset_saving_path: str,
+    stage_state: dict,
+    download_fingerprint: str,
+    refresh: bool = False,
+    cancel_event: threading.Event = None,
+) -> dict:
+    """Run the download & extract stage if the raw data is missing or the download links have changed,
+    and re-fetch the files failing the verification against the download manifest, or modified on the servers
+    since downloaded if `refresh`. Should be called with the dataset lock held. Returns the updated stage state.
+    The downloads are aborted once `cancel_event` is set.
+    """
+    download_kwargs = {
+        "select_members": _get_member_selector(dataset_name),
+        "use_blob_store": get_config("download", "blob_store").lower() == "true",
+        "cancel_event": cancel_event,
+    }
+    unverified_links = []
+    if stage_state["download"] == download_fingerprint:
+        unverified_links = verify_download(dataset_name, dataset_saving_path)
+    if len(unverified_links) > 0:
+        logger.warning(
+            f"‼️ {len(unverified_links)} files of dataset {dataset_name} are missing or fail the verification. "
+            f"Re-fetching them..."
+        )
+        download_and_extract(
+            dataset_name, dataset_saving_path, refresh=refresh, **download_kwargs
+        )
+    elif stage_state["download"] != download_fingerprint:
+        if stage_state["download"] is not None:
+            logger.info(
+                f"Download links of dataset {dataset_name} have changed. Re-downloading..."
+            )
+            shutil.rmtree(dataset_saving_path, ignore_errors=True)
+            stage_state = {"download": None, "caches": {}}
+        download_and_extract(
+            dataset_name, dataset_saving_path, refresh=refresh, **download_kwargs
+        )
+        stage_state["download"] = download_fingerprint
+        _write_stage_state(dataset_saving_path, stage_state)
+    elif refresh:
+        logger.info(
+            f"Revalidating the downloaded files of dataset {dataset_name} with the servers..."
+        )
+        download_and_extract(
+            dataset_name, dataset_saving_path, refresh=True, **download_kwargs
+        )
+    else:
+        logger.info(
+            f"Dataset {dataset_name} has already been downloaded. Processing directly..."
+        )
+    return stage_state
+
+
+def _run_stages(
+    dataset_name: str,
+    dataset_saving_path: str,
+    cache_format: str,
+    use_cache: bool,
+    compression: str,
+    compression_level: Optional[int],
+    dtype_policy: str = "default",
+    cancel_event: threading.Event = None,
+) -> Tuple[Optional[dict], bool]:
+    """Run the stages of the dataset whose inputs have changed. Should be called with the dataset lock held.
+    The downloads are aborted once `cancel_event` is set.
+
+    Returns
+    -------
+    result :
+        The dataset the cache was built from, freshly parsed or loaded from a cache in another format, if the cache
+        was built, otherwise None.
+
+    cached :
+        Whether the cache in the given format is ready.
+
+    """
+    if not use_cache and len(read_manifest(dataset_saving_path)) == 0:
+        # without validators of the downloaded files, delete the dataset dir to rerun all stages
+        shutil.rmtree(dataset_saving_path, ignore_errors=True)
+
+    stage_state = _read_stage_state(dataset_saving_path)
+    download_fingerprint = _get_download_fingerprint(dataset_name)
+    parse_fingerprint = _get_parse_fingerprint(dataset_name, download_fingerprint)
+
+    # a fresh cache needs no raw data, which may have been evicted for the disk quota
+    cache_key = _get_cache_key(cache_format, dtype_policy)
+    cache_path = get_cache_path(
+        dataset_saving_path, dataset_name, cache_format, dtype_policy
+    )
+    if (
+        use_cache
+        and _is_cache_fresh(stage_state, cache_key, parse_fingerprint)
+        and cache_exists(cache_path, cache_format)
+    ):
+        logger.info(
+            f"Dataset {dataset_name} has already been cached. Loading from cache directly..."
+        )
+        stage_state["last_access"] = time.time()
+        _write_stage_state(dataset_saving_path, stage_state)
+        return None, True
+
+    # a fresh cache in another format holds the parsed dataset already, e.g. the pickle one when switched from
+    # the pickle format for memory mapping, lazy loading, or pushdown, and needs no raw data either
+    result = None
+    if use_cache:
+        result = _load_other_fresh_cache(
+            dataset_saving_path,
+            dataset_name,
+            stage_state,
+            parse_fingerprint,
+            cache_format,
+            dtype_policy,
+        )
+    if result is None:
+        # without use_cache, only re-fetch the files modified on the servers
+        stage_state = _run_download_stage(
+            dataset_name,
+            dataset_saving_path,
+            stage_state,
+            download_fingerprint,
+            refresh=not use_cache,
+            cancel_event=cancel_event,
+        )
+
+        # stage parse & cache: rerun if the cache is missing or made by another loading function or TSDB version,
+        # or for all caches without use_cache, purged only now so that they survive a failed refresh
+        _purge_stale_caches(
+            dataset_saving_path,
+            dataset_name,
+            stage_state,
+            parse_fingerprint if use_cache else None,
+        )
+        loading_func = _get_loading_func(dataset_name)
+        try:
+            if "dtype_policy" in inspect.signature(loading_func).parameters:
+                # downcast while parsing, so that the float64 copy of large tables is never created
+                result = loading_func(dataset_saving_path, dtype_policy=dtype_policy)
+            else:
+                result = loading_func(dataset_saving_path)
+        except FileExistsError:
+            shutil.rmtree(dataset_saving_path, ignore_errors=True)
+            warnings.warn(
+                "Dataset corrupted. Just deleted it. "
+                "Please rerun the function tsdb.load(dataset_name) to re-download the raw data."
+            )
+            return None, False
+        if result is None:
+            # the loading function failed and has warned, nothing to cache
+            return None, False
+        result = apply_dtype_policy(result, dtype_policy)
+
+    save_cache(
+        result,
+        cache_path,
+        cache_format,
+        compression,
+        compression_level,
+        _PARTITION_KEYS.get(dataset_name),
+        int(get_config("cache", "partition_rows")),
+        int(get_config("cache", "row_group_rows")),
+    )
+    cached = cache_exists(cache_path, cache_format)
+    if cached:
+        stage_state["caches"][cache_key] = {
+            "fingerprint": parse_fingerprint,
+            "compression": compression,
+            "raw_bytes": estimate_nbytes(result),
+            "decode_seconds": None,
+        }
+    stage_state["last_access"] = time.time()
+    _write_stage_state(dataset_saving_path, stage_state)
+    return result, cached
+
+
+def _evict_raw_files(dataset_saving_path: str) -> int:
+    """Delete the downloaded raw files of the dataset but keep its processed caches. Returns the freed bytes."""
+    stage_state = _read_stage_state(dataset_saving_path)
+    freed_bytes, evicted = 0, False
+    for f in os.listdir(dataset_saving_path):
+        # hidden files are TSDB's own records
+        if f.startswith(".") or is_cache_path(f):
+            continue
+        file_path = os.path.join(dataset_saving_path, f)
+        # raw files linked from the blob store free no space until the blobs are evicted
+        freed_bytes += get_freeable_size(file_path)
+        purge_path(file_path)
+        evicted = True
+    if evicted:
+        stage_state["download"] = None
+        _write_stage_state(dataset_saving_path, stage_state)
+    return freed_bytes
+
+
+def _evict_stored_downloads(total_bytes: int, max_disk_bytes: int) -> int:
+    """Evict stored downloads not linked into dataset dirs for the disk quota. Returns the remaining total bytes."""
+    freed_bytes = evict_blobs(
+        os.path.join(CACHED_DATASET_DIR, BLOB_STORE_DIR_NAME),
+        total_bytes - max_disk_bytes,
+    )
+    if freed_bytes > 0:
+        logger.info(
+            f"Evicted stored downloads to free {freed_bytes} bytes for the disk quota {max_disk_bytes} bytes."
+        )
+    return total_bytes - freed_bytes
+
+
+def _enforce_disk_quota(protected_dataset: str) -> None:
+    """Evict the least recently used datasets if tsdb_home exceeds the disk quota `max_disk_bytes` in config.ini.
+    Stored downloads not linked into dataset dirs are evicted first, then raw files before processed caches,
+    since caches are enough for loading and usually much smaller.
+    The given dataset being loaded and the datasets locked by other processes are never evicted.
+    """
+    max_disk_bytes = int(get_config("cache", "max_disk_bytes"))
+    if max_disk_bytes <= 0:
+        return
+    total_bytes = get_size(CACHED_DATASET_DIR)
+    if total_bytes <= max_disk_bytes:
+        return
+
+    datasets = []
+    for cached_dataset in list_cache():
+        dataset_saving_path = os.path.join(CACHED_DATASET_DIR, cached_dataset)
+        if cached_dataset != protected_dataset and os.path.isdir(dataset_saving_path):
+            last_access = _read_stage_state(dataset_saving_path)["last_access"]
+            datasets.append((last_access, cached_dataset))
+    datasets.sort()  # the least recently used first
+
+    # stored files not linked into dataset dirs, e.g. archives whose contents are extracted, only save downloading
+    total_bytes = _evict_stored_downloads(total_bytes, max_disk_bytes)
+    for evict_caches in [False, True]:
+        for _, cached_dataset in datasets:
+            if total_bytes <= max_disk_bytes:
+                return
+            dataset_saving_path = os.path.join(CACHED_DATASET_DIR, cached_dataset)
+            lock = FileLock(get_lock_path(dataset_saving_path))
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if not os.path.exists(dataset_saving_path):
+                    continue
+                if evict_caches:
+                    freed_bytes = get_freeable_size(dataset_saving_path)
+                    purge_path(dataset_saving_path)
+                else:
+                    freed_bytes = _evict_raw_files(dataset_saving_path)
+            finally:
+                lock.release()
+            if freed_bytes > 0:
+                logger.info(
+                    f"Evicted {'dataset' if evict_caches else 'raw files of'} {cached_dataset} to free "
+                    f"{freed_bytes} bytes for the disk quota {max_disk_bytes} bytes."
+                )
+            total_bytes -= freed_bytes
+        # the stored files linked by the evicted files are not linked into dataset dirs any more
+        if total_bytes > max_disk_bytes:
+            total_bytes = _evict_stored_downloads(total_bytes, max_disk_bytes)
+
+    # measured again rather than trusting the freed bytes, e.g. other processes may have written meanwhile
+    total_bytes = get_size(CACHED_DATASET_DIR)
+    if total_bytes > max_disk_bytes:
+        logger.warning(
+            f"‼️ tsdb_home {CACHED_DATASET_DIR} still takes {total_bytes} bytes, exceeding the disk quota "
+            f"{max_disk_bytes} bytes after eviction."
+        )
+
+
 def list() -> list:
     """List the database.
 
@@ -41,7 +527,20 @@ def list() -> list:
     return AVAILABLE_DATASETS
 
 
-def load(dataset_name: str, use_cache: bool = True) -> dict:
+def load(
+    dataset_name: str,
+    use_cache: bool = True,
+    cache_format: str = None,
+    compression: str = None,
+    mmap: bool = None,
+    lazy: bool = False,
+    columns: list = None,
+    filters: list = None,
+    entities: list = None,
+    partitions: list = None,
+    dtype_policy: str = "default",
+    copy: bool = True,
+) -> Union[dict, LazyDataset]:
     """Load dataset with given name.
 
     Parameters
@@ -50,17 +549,140 @@ def load(dataset_name: str, use_cache: bool = True) -> dict:
         The name of the specific dataset in database.DATABASE.
 
     use_cache : bool,
-        Whether to use cache (including data downloading and processing)
+        Whether to use cache (including data downloading and processing).
+        Even with cache, the pipeline stages are rerun if their inputs have changed: the raw data is re-downloaded
+        if the dataset's download links in the database have changed, and the cache is re-generated from the raw data
+        if the loading function's source or the TSDB version has changed.
+        Without cache, the processed caches are rebuilt, and the downloaded files are revalidated with conditional
+        requests carrying their ETag and Last-Modified, so that only files modified on the servers are re-fetched.
+        Files failing to be revalidated are kept, and the caches are only purged once the download stage succeeded.
+
+    cache_format : str, optional
+        The format of the processed cache, should be one of "pickle", "parquet", and "feather".
+        "pickle" saves the whole result dict into a single pickle file. "parquet" and "feather" save each DataFrame
+        in the result dict as a columnar file with pyarrow (other values are kept in a small manifest), which are
+        faster to load with pyarrow's multithreaded readers and smaller on disk.
+        If not given, the value `cache_format` in the section `cache` of config.ini will be used.
+
+    compression : str, optional
+        The codec compressing the cache when it is written, should be one of "none", "lz4", and "zstd".
+        The level of the codec is set by `compression_level` in the section `cache` of config.ini.
+        An existing cache is used as it is regardless of its codec. Run tsdb.list_cache(detailed=True) to compare
+        the disk size and the decoding throughput of caches with different codecs.
+        If not given, the value `compression` in the section `cache` of config.ini will be used.
+
+    mmap : bool, optional
+        Whether to open ndarray values (e.g. X_train and X_test of UCR/UEA datasets) in the cache as read-only
+        memory maps with numpy.load(mmap_mode="r"). Warm loads are then O(1), and processes on the same node share the
+        page cache instead of each holding a private copy. It needs a columnar cache, so the "parquet" format is used
+        if `cache_format` is "pickle", and the parquet cache is built from the pickle one if it is fresh.
+        If not given, the value `mmap` in the section `cache` of config.ini will be used.
+
+    lazy : bool,
+        Whether to return a read-only dict-like LazyDataset, whose values are read from their own files in the cache
+        on the first access and then retained. Only the keys touched are materialized, e.g. only set-a of
+        physionet_2012. It needs a per-key cache, so the "parquet" format is used if `cache_format` is "pickle",
+        and the parquet cache is built from the pickle one if it is fresh.
+
+    columns : list, optional
+        Names of the columns to read from each DataFrame in the dataset, e.g. ["RecordID", "HR", "SepsisLabel"].
+        Columns that a DataFrame does not have are ignored, and its index is always kept.
+        They are pushed down to the cache, so the other columns are never read or decoded.
+
+    filters : list, optional
+        Row filters in pyarrow's disjunctive normal form, e.g. [("station", "=", "Aoti")] or
+        [[("RecordID", "=", "p000001")], [("RecordID", "=", "p000002")]], see `filters` of
+        pyarrow.parquet.read_table(). They are applied to each DataFrame holding all the columns referenced.
+        With the "parquet" format, row groups of `row_group_rows` (in the section `cache` of config.ini) rows that
+        cannot match are skipped with their statistics. An empty list filters out no row, like None.
+
+    entities : list, optional
+        Keys of the entities to load from large multi-entity datasets, e.g. RecordIDs of physionet patients or MMSIs
+        of vessel_ais vessels. Their parquet/feather caches are partitioned by the entity key into files of about
+        `partition_rows` (in the section `cache` of config.ini) rows plus a partition index, so only the partition
+        files holding the given entities are read.
+
+    partitions : list, optional
+        Indices of the partitions to load from partitioned DataFrames, e.g. list(range(rank, n, world_size)) to give
+        each worker its own partitions. Indices beyond the number of partitions of a DataFrame are ignored.
+        Run tsdb.list_partitions() to see the partitions of a dataset.
+
+        `columns`, `filters`, `entities`, and `partitions` work on the cached result, without re-parsing the raw
+        files. They need a columnar cache, so the "parquet" format is used if `cache_format` is "pickle", and the
+        parquet cache is built from the pickle one if it is fresh.
+
+    dtype_policy : str,
+        The policy of numeric dtypes, should be one of "default" and "compact". "default" keeps the dtypes parsed by
+        pandas, e.g. float64. "compact" downcasts floats to float32 and integers to the smallest nullable integer
+        dtypes (e.g. Int8) holding them, halving the memory footprint of most datasets. Loading functions of large
+        datasets, e.g. electricity_load_diagrams, pems_traffic, and physionet_2012, downcast while parsing, so the
+        float64 copy is never created. "compact" also encodes string columns with repeated values as categoricals
+        (e.g. RecordID of physionet_2019, station and wd of beijing_multisite_air_quality), and string labels of
+        UCR/UEA datasets as integer codes with the lookup table `y_classes`. Each policy has its own cache, saved in
+        the downcast and encoded dtypes.
+
+    copy : bool,
+        Whether to return a defensive deep copy when the dataset is hit in the in-process memory cache, otherwise the
+        cached object shared with other callers is returned and must not be modified in place.
+        The memory cache is disabled by default, set its byte budget `memory_cache_max_bytes` in the section `cache`
+        of config.ini or with tsdb.set_memory_cache_max_bytes() to enable it. Lazy loads are not memory-cached.
 
     Returns
     -------
     result:
-        Loaded dataset in a Python dict.
+        Loaded dataset in a Python dict, or a LazyDataset if `lazy` is True.
     """
     assert dataset_name in AVAILABLE_DATASETS, (
         f'The given dataset name "{dataset_name}" is not in the database. '
         f"Please fetch the full list of the available dataset_profiles with tsdb.list()"
     )
+    cache_format = (
+        get_config("cache", "cache_format") if cache_format is None else cache_format
+    )
+    assert (
+        cache_format in CACHE_FORMATS
+    ), f"cache_format should be one of {CACHE_FORMATS}, but got {cache_format}"
+    compression = (
+        get_config("cache", "compression") if compression is None else compression
+    )
+    assert (
+        compression in COMPRESSIONS
+    ), f"compression should be one of {COMPRESSIONS}, but got {compression}"
+    assert (
+        dtype_policy in DTYPE_POLICIES
+    ), f"dtype_policy should be one of {DTYPE_POLICIES}, but got {dtype_policy}"
+    compression_level = get_config("cache", "compression_level")
+    compression_level = int(compression_level) if compression_level else None
+    mmap = get_config("cache", "mmap").lower() == "true" if mmap is None else mmap
+    # an empty disjunction would select no row for pyarrow, take it as no filter like LazyDataset does
+    filters = filters if filters else None
+    pushdown = any(arg is not None for arg in [columns, filters, entities, partitions])
+    if (mmap or lazy or pushdown) and cache_format == "pickle":
+        logger.warning(
+            "‼️ Memory mapping, lazy loading, and column/row/partition pushdown need a per-key columnar cache, "
+            "which the pickle cache is not. Using cache_format parquet instead."
+        )
+        cache_format = "parquet"
+
+    memory_cache_key = (
+        dataset_name,
+        cache_format,
+        mmap,
+        None if columns is None else tuple(columns),
+        repr(filters),
+        None if entities is None else tuple(entities),
+        None if partitions is None else tuple(partitions),
+        dtype_policy,
+    )
+    if not use_cache:
+        MEMORY_CACHE.invalidate(lambda key: key[0] == dataset_name)
+    elif not lazy:
+        result = MEMORY_CACHE.get(memory_cache_key, return_copy=copy)
+        if result is not None:
+            logger.info(
+                f"Loaded dataset {dataset_name} from the in-process memory cache."
+            )
+            return result
 
     profile_dir = dataset_name if "ucr_uea_" not in dataset_name else "ucr_uea_datasets"
     logger.info(
@@ -70,90 +692,365 @@ def load(dataset_name: str, use_cache: bool = True) -> dict:
     )
 
     dataset_saving_path = os.path.join(CACHED_DATASET_DIR, dataset_name)
-    if not os.path.exists(
-        dataset_saving_path
-    ):  # if the dataset is not cached, then download it
-        download_and_extract(dataset_name, dataset_saving_path)
-    else:
-        if use_cache:
-            logger.info(
-                f"Dataset {dataset_name} has already been downloaded. Processing directly..."
+    cache_path = get_cache_path(
+        dataset_saving_path, dataset_name, cache_format, dtype_policy
+    )
+    lock_path = get_lock_path(dataset_saving_path)
+    decode_seconds = None
+    while True:
+        # concurrent processes, e.g. DDP ranks, wait here while the first one downloads and processes the dataset
+        with FileLock(lock_path):
+            result, cached = _run_stages(
+                dataset_name,
+                dataset_saving_path,
+                cache_format,
+                use_cache,
+                compression,
+                compression_level,
+                dtype_policy,
+            )
+        if not cached or not (
+            result is None or ((mmap or lazy or pushdown) and cache_format != "pickle")
+        ):
+            break
+        # load from the cache, or reopen the fresh cache to swap the parsed values for memory maps,
+        # a lazy handle, or projected frames. The shared lock keeps other processes from purging or evicting
+        # the cache while it is read, but lets them read it at the same time.
+        with FileLock(lock_path, shared=True):
+            if cache_exists(cache_path, cache_format):
+                start_time = time.time()
+                result = load_cache(
+                    cache_path,
+                    cache_format,
+                    mmap,
+                    lazy,
+                    columns,
+                    filters,
+                    entities,
+                    partitions,
+                    lock_path,
+                )
+                decode_seconds = time.time() - start_time
+                break
+        # another process purged the cache between the two locks, e.g. with use_cache=False, rerun the stages
+        use_cache = True
+    if decode_seconds is not None and not (mmap or lazy or pushdown):
+        # only full decodes tell the throughput of the cache
+        _record_decode_seconds(
+            dataset_saving_path,
+            _get_cache_key(cache_format, dtype_policy),
+            decode_seconds,
+        )
+
+    _enforce_disk_quota(dataset_name)
+
+    if not lazy and result is not None:
+        if MEMORY_CACHE.put(memory_cache_key, result) and copy:
+            # the cached object stays untouched by the caller
+            result = deepcopy(result)
+
+    logger.info("Loaded successfully!")
+    return result
+
+
+def publish(dataset_name: str, name: str = None, **kwargs) -> SharedDataset:
+    """Load the dataset once and publish its arrays into shared memory, so DataLoader workers and multiprocessing
+    pools on the same node can attach to it with tsdb.attach(name) instead of each holding a private copy.
+
+    Parameters
+    ----------
+    dataset_name : str,
+        The name of the specific dataset in database.DATABASE.
+
+    name : str, optional
+        The name to publish the dataset under, which has to be unique on the node.
+        If not given, it is "tsdb_" plus the dataset name.
+
+    kwargs :
+        Other arguments passed to tsdb.load(), e.g. `cache_format` and `columns`. `lazy` is not supported.
+
+    Returns
+    -------
+    shared_dataset :
+        A read-only dict-like SharedDataset, whose ndarray values and numeric DataFrame columns are zero-copy views of
+        the shared memory blocks. The blocks are unlinked when the last process holding the dataset calls its detach(),
+        so call it when done with the dataset, or use the dataset as a context manager.
+    """
+    assert not kwargs.get(
+        "lazy", False
+    ), "A lazy dataset cannot be published into shared memory."
+    name = f"tsdb_{dataset_name}" if name is None else name
+    # the copy is published instead, no need to copy the dataset in the memory cache
+    result = load(dataset_name, copy=False, **kwargs)
+    return publish_dataset(result, name)
+
+
+def _get_prefetch_size(dataset_name: str) -> int:
+    # downloaded datasets only need parsing, which takes time in proportion to their raw data
+    dataset_saving_path = os.path.join(CACHED_DATASET_DIR, dataset_name)
+    stage_state = _read_stage_state(dataset_saving_path)
+    if stage_state["download"] == _get_download_fingerprint(dataset_name):
+        return get_size(dataset_saving_path)
+    return get_download_size(dataset_name)
+
+
+def _prefetch_dataset(
+    dataset_name: str,
+    parse: bool,
+    cache_format: str,
+    compression: str,
+    compression_level: Optional[int],
+    dtype_policy: str,
+    cancel_event: threading.Event,
+) -> float:
+    """Download the dataset and build its cache if `parse`, returning the seconds taken.
+    The download is aborted once `cancel_event` is set."""
+    start_time = time.time()
+    dataset_saving_path = os.path.join(CACHED_DATASET_DIR, dataset_name)
+    with FileLock(get_lock_path(dataset_saving_path)):
+        if parse:
+            _, cached = _run_stages(
+                dataset_name,
+                dataset_saving_path,
+                cache_format,
+                True,
+                compression,
+                compression_level,
+                dtype_policy,
+                cancel_event,
             )
+            if not cached:
+                raise RuntimeError(f"failed to parse and cache dataset {dataset_name}")
         else:
-            # if not use cache, then delete the downloaded data dir (including processing cache)
-            shutil.rmtree(dataset_saving_path, ignore_errors=True)
-            download_and_extract(dataset_name, dataset_saving_path)
+            _run_download_stage(
+                dataset_name,
+                dataset_saving_path,
+                _read_stage_state(dataset_saving_path),
+                _get_download_fingerprint(dataset_name),
+                cancel_event=cancel_event,
+            )
+    _enforce_disk_quota(dataset_name)
+    return time.time() - start_time
 
-    # if cached, then load directly
-    cache_path = os.path.join(dataset_saving_path, dataset_name + "_cache.pkl")
-    if os.path.exists(cache_path):
-        logger.info(
-            f"Dataset {dataset_name} has already been cached. Loading from cache directly..."
+
+def prefetch(
+    dataset_names: list,
+    max_workers: int = None,
+    parse: bool = True,
+    cache_format: str = None,
+    dtype_policy: str = "default",
+) -> dict:
+    """Download and cache many datasets concurrently, e.g. all UCR/UEA datasets for benchmarking, so that later
+    tsdb.load() calls only read the caches. Datasets are scheduled from the largest, keeping the long ones from
+    starting last, and one aggregate progress bar is shown instead of those of single files.
+    Failures of some datasets do not stop the others.
+
+    Parameters
+    ----------
+    dataset_names : list,
+        Names of the datasets in database.DATABASE.
+
+    max_workers : int, optional
+        The number of datasets processed concurrently.
+        If not given, the value `max_workers` in the section `download` of config.ini will be used.
+
+    parse : bool,
+        Whether to parse the datasets and build their caches as well, otherwise only download them.
+
+    cache_format : str, optional
+        The format of the caches to build, see tsdb.load().
+        If not given, the value `cache_format` in the section `cache` of config.ini will be used.
+
+    dtype_policy : str,
+        The dtype policy of the caches to build, see tsdb.load().
+
+    Returns
+    -------
+    report :
+        A dict keyed by the dataset names, whose values tell whether the dataset is prefetched `success`fully,
+        its size in `bytes` (0 if unknown), the `seconds` taken, and the `error` message if it failed.
+    """
+    for dataset_name in dataset_names:
+        assert dataset_name in AVAILABLE_DATASETS, (
+            f'The given dataset name "{dataset_name}" is not in the database. '
+            f"Please fetch the full list of the available dataset_profiles with tsdb.list()"
         )
-        result = pickle_load(cache_path)
-    else:
-        try:
-            if dataset_name == "physionet_2012":
-                result = load_physionet2012(dataset_saving_path)
-            elif dataset_name == "physionet_2019":
-                result = load_physionet2019(dataset_saving_path)
-            elif dataset_name == "electricity_load_diagrams":
-                result = load_electricity(dataset_saving_path)
-            elif dataset_name == "electricity_transformer_temperature":
-                result = load_ett(dataset_saving_path)
-            elif dataset_name == "beijing_multisite_air_quality":
-                result = load_beijing_air_quality(dataset_saving_path)
-            elif dataset_name == "italy_air_quality":
-                result = load_italy_air_quality(dataset_saving_path)
-            elif dataset_name == "vessel_ais":
-                result = load_ais(dataset_saving_path)
-            elif dataset_name == "pems_traffic":
-                result = load_pems_traffic(dataset_saving_path)
-            elif dataset_name == "solar_alabama":
-                result = load_solar_alabama(dataset_saving_path)
-            elif "ucr_uea_" in dataset_name:
-                actual_dataset_name = dataset_name.replace(
-                    "ucr_uea_", ""
-                )  # delete 'ucr_uea_' in the name
-                result = load_ucr_uea_dataset(dataset_saving_path, actual_dataset_name)
-            else:
-                raise NotImplementedError(
-                    f"Dataset {dataset_name} is not supported yet. "
-                    f"Please check the dataset name or contribute it to TSDB https://github.com/WenjieDu/TSDB/."
+    cache_format = (
+        get_config("cache", "cache_format") if cache_format is None else cache_format
+    )
+    assert (
+        cache_format in CACHE_FORMATS
+    ), f"cache_format should be one of {CACHE_FORMATS}, but got {cache_format}"
+    assert (
+        dtype_policy in DTYPE_POLICIES
+    ), f"dtype_policy should be one of {DTYPE_POLICIES}, but got {dtype_policy}"
+    compression = get_config("cache", "compression")
+    compression_level = get_config("cache", "compression_level")
+    compression_level = int(compression_level) if compression_level else None
+    max_workers = (
+        int(get_config("download", "max_workers"))
+        if max_workers is None
+        else max_workers
+    )
+    assert max_workers > 0, f"max_workers should be positive, but got {max_workers}"
+    dataset_names = [*dict.fromkeys(dataset_names)]
+
+    report = {}
+    # set when interrupted, aborting the running downloads at their next chunk
+    cancel_event = threading.Event()
+    # not a with block, whose exit would wait for the running datasets when interrupted
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {}
+    try:
+        sizes = dict(
+            zip(dataset_names, executor.map(_get_prefetch_size, dataset_names))
+        )
+        # the largest first, so that the long downloads overlap with the short ones rather than running last
+        futures = {
+            executor.submit(
+                _prefetch_dataset,
+                dataset_name,
+                parse,
+                cache_format,
+                compression,
+                compression_level,
+                dtype_policy,
+                cancel_event,
+            ): dataset_name
+            for dataset_name in sorted(dataset_names, key=sizes.get, reverse=True)
+        }
+        with quiet_file_progress(), tqdm(
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            total=sum(sizes.values()),
+            desc=f"Prefetching {len(dataset_names)} datasets",
+        ) as pbar:
+            for future in as_completed(futures):
+                dataset_name = futures[future]
+                error = future.exception()
+                report[dataset_name] = {
+                    "success": error is None,
+                    "bytes": sizes[dataset_name],
+                    "seconds": future.result() if error is None else None,
+                    "error": None if error is None else str(error),
+                }
+                if error is not None:
+                    logger.error(
+                        f"❌ Failed to prefetch dataset {dataset_name}: {error}"
+                    )
+                pbar.update(sizes[dataset_name])
+                pbar.set_postfix(
+                    done=len(report),
+                    failed=sum(not r["success"] for r in report.values()),
                 )
+    except KeyboardInterrupt:
+        # datasets being parsed cannot be aborted, they finish in the background
+        shutdown_executor(executor, futures, cancel_event, wait=False)
+        raise KeyboardInterrupt("Prefetching cancelled by the user.")
+    finally:
+        executor.shutdown(wait=not cancel_event.is_set())
 
-        except FileExistsError:
-            shutil.rmtree(dataset_saving_path, ignore_errors=True)
-            warnings.warn(
-                "Dataset corrupted. Just deleted it. "
-                "Please rerun the function tsdb.load(dataset_name) to re-download the raw data."
-            )
-        pickle_dump(result, cache_path)
+    n_succeeded = sum(r["success"] for r in report.values())
+    logger.info(f"Prefetched {n_succeeded} of {len(dataset_names)} datasets.")
+    return {dataset_name: report[dataset_name] for dataset_name in dataset_names}
 
-    logger.info("Loaded successfully!")
-    return result
 
+def list_partitions(dataset_name: str, cache_format: str = None) -> dict:
+    """List the partitions of the DataFrames in a large multi-entity dataset, e.g. physionet_2012 and vessel_ais,
+    whose parquet/feather caches are partitioned by the entity key. The dataset is loaded lazily first if not cached.
 
-def list_cache() -> list:
+    Parameters
+    ----------
+    dataset_name : str,
+        The name of the specific dataset in database.DATABASE.
+
+    cache_format : str, optional
+        The format of the processed cache, should be "parquet" or "feather".
+        If not given, the value `cache_format` in the section `cache` of config.ini will be used, or "parquet" if it
+        is "pickle".
+
+    Returns
+    -------
+    dict,
+        The partitions of each partitioned DataFrame, keyed by the dataset keys. Each partition is a dict holding its
+        `file`, its `num_rows`, and the keys of its `entities`. Pass the indices of partitions or the entities to
+        tsdb.load() to load only them.
+
+    """
+    dataset = load(dataset_name, cache_format=cache_format, lazy=True)
+    return read_partition_index(dataset.cache_path)
+
+
+def list_cache(detailed: bool = False) -> list:
     """List names of all cached datasets.
 
+    Parameters
+    ----------
+    detailed : bool,
+        Whether to report the size of every cached dataset and its processed caches rather than only names.
+
     Returns
     -------
     list,
-        A list contains all cached datasets' names.
+        A list contains all cached datasets' names. If `detailed` is True, a list of dicts, each contains
+        `dataset_name`, `total_bytes` of the dataset dir, the timestamp `last_access` of the last time it was
+        loaded, and `caches`, a list of dicts describing its processed caches with `cache_format`, `dtype_policy`,
+        `compression`, the on-disk size `disk_bytes`, the in-memory size `raw_bytes`, `compression_ratio`, the last
+        full decoding time `decode_seconds`, and `decode_throughput` in raw bytes per second (the last two are None
+        if the cache has not been fully decoded yet).
 
     """
     if not os.path.exists(CACHED_DATASET_DIR):
         os.makedirs(CACHED_DATASET_DIR)
         return []
     else:
-        dir_content = os.listdir(CACHED_DATASET_DIR)
-
-        # remove unrelated content
-        if ".DS_Store" in dir_content:
-            dir_content.remove(".DS_Store")
+        # remove unrelated content, e.g. .DS_Store and the lock files under .locks
+        dir_content = [
+            f for f in os.listdir(CACHED_DATASET_DIR) if not f.startswith(".")
+        ]
+        if not detailed:
+            return dir_content
 
-        return dir_content
+        report = []
+        for cached_dataset in dir_content:
+            dataset_saving_path = os.path.join(CACHED_DATASET_DIR, cached_dataset)
+            stage_state = _read_stage_state(dataset_saving_path)
+            caches = []
+            for cache_key, cache_info in stage_state["caches"].items():
+                cache_format, _, dtype_policy = cache_key.partition("/")
+                dtype_policy = dtype_policy if dtype_policy else "default"
+                cache_path = get_cache_path(
+                    dataset_saving_path, cached_dataset, cache_format, dtype_policy
+                )
+                disk_bytes = get_size(cache_path)
+                raw_bytes = cache_info["raw_bytes"]
+                decode_seconds = cache_info["decode_seconds"]
+                caches.append(
+                    {
+                        "cache_format": cache_format,
+                        "dtype_policy": dtype_policy,
+                        "compression": cache_info["compression"],
+                        "disk_bytes": disk_bytes,
+                        "raw_bytes": raw_bytes,
+                        "compression_ratio": (
+                            raw_bytes / disk_bytes if disk_bytes > 0 else None
+                        ),
+                        "decode_seconds": decode_seconds,
+                        "decode_throughput": (
+                            raw_bytes / decode_seconds if decode_seconds else None
+                        ),
+                    }
+                )
+            report.append(
+                {
+                    "dataset_name": cached_dataset,
+                    "total_bytes": get_size(dataset_saving_path),
+                    "last_access": stage_state["last_access"],
+                    "caches": caches,
+                }
+            )
+        return report
 
 
 def delete_cache(dataset_name: str = None, only_pickle: bool = False) -> None:
@@ -167,7 +1064,7 @@ def delete_cache(dataset_name: str = None, only_pickle: bool = False) -> None:
         Delete all cached datasets if dataset_name is left as None.
 
     only_pickle : bool,
-        Whether to delete only the cached pickle file.
+        Whether to delete only the processed cache, i.e. the cached pickle file or the parquet/feather cache dir.
         When the preprocessing pipeline TSDB is changed, users may want to only delete the cached pickle file which is
         generated by the old pipeline but keep the downloaded raw data. This option is designed for this purpose.
 
@@ -182,11 +1079,11 @@ def delete_cache(dataset_name: str = None, only_pickle: bool = False) -> None:
                 f"`dataset_name` not given. Purging all cached data under {CACHED_DATASET_DIR}..."
             )
             if only_pickle:
-                for cached_dataset in os.listdir(CACHED_DATASET_DIR):
+                for cached_dataset in list_cache():
                     for file in os.listdir(
                         os.path.join(CACHED_DATASET_DIR, cached_dataset)
                     ):
-                        if file.endswith(".pkl"):
+                        if is_cache_path(file):
                             purge_path(
                                 os.path.join(CACHED_DATASET_DIR, cached_dataset, file)
                             )
@@ -199,7 +1096,7 @@ def delete_cache(dataset_name: str = None, only_pickle: bool = False) -> None:
             ), f"{dataset_name} is not available in TSDB, so it has no cache. Please check your dataset name."
             if only_pickle:
                 for file in os.listdir(os.path.join(CACHED_DATASET_DIR, dataset_name)):
-                    if file.endswith(".pkl"):
+                    if is_cache_path(file):
                         purge_path(os.path.join(CACHED_DATASET_DIR, dataset_name, file))
             else:
                 dir_to_delete = os.path.join(CACHED_DATASET_DIR, dataset_name)
@@ -228,3 +228,8 @@ for i in _ucr_uea_datasets:
 
 DATABASE = {**_DATABASE, **UCR_UEA_DATASETS}
 AVAILABLE_DATASETS = list(DATABASE.keys())
+
+# optional expected sizes and SHA-256 digests of downloaded files, keyed by download links, e.g.
+# {"https://www.physionet.org/files/challenge-2012/1.0.0/set-a.tar.gz": {"size": 123, "sha256": "..."}},
+# downloads are verified against them, and links without entries are only checked against their Content-Length
+CHECKSUMS = {}
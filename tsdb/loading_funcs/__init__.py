@@ -11,7 +11,7 @@ from .electricity_transformer_temperature import load_ett
 from .italy_air_quality import load_italy_air_quality
 from .physionet_2012 import load_physionet2012
 from .physionet_2019 import load_physionet2019
-from .ucr_uea_datasets import load_ucr_uea_dataset
+from .ucr_uea_datasets import load_ucr_uea_dataset, select_ucr_uea_members
 from .vessel_ais import load_ais
 from .pems_traffic import load_pems_traffic
 from .solar_alabama import load_solar_alabama
@@ -22,6 +22,7 @@ __all__ = [
     "load_physionet2012",
     "load_physionet2019",
     "load_ucr_uea_dataset",
+    "select_ucr_uea_members",
     "load_ais",
     "load_ett",
     "load_italy_air_quality",
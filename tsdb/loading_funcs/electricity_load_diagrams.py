@@ -13,8 +13,10 @@ import os
 
 import pandas as pd
 
+from ..utils.dtypes import get_float_dtype
 
-def load_electricity(local_path):
+
+def load_electricity(local_path, dtype_policy="default"):
     """Load dataset Electricity Load Diagrams.
 
     Parameters
@@ -22,6 +24,9 @@ def load_electricity(local_path):
     local_path : str,
         The local path of dir saving the raw data of Electricity Load Diagrams.
 
+    dtype_policy : str,
+        The dtype policy, "compact" parses float columns as float32 rather than float64. See tsdb.load().
+
     Returns
     -------
     data : dict
@@ -30,7 +35,13 @@ def load_electricity(local_path):
                 The time-series data of Electricity Load Diagrams.
     """
     file_path = os.path.join(local_path, "LD2011_2014.txt")
-    df = pd.read_csv(file_path, index_col=0, sep=";", decimal=",")
+    float_dtype = get_float_dtype(dtype_policy)
+    dtype = None
+    if float_dtype is not None:
+        # all columns except the index are float
+        columns = pd.read_csv(file_path, sep=";", nrows=0).columns
+        dtype = {c: float_dtype for c in columns[1:]}
+    df = pd.read_csv(file_path, index_col=0, sep=";", decimal=",", dtype=dtype)
     df.index = pd.to_datetime(df.index)
     data = {
         "X": df,
@@ -13,8 +13,10 @@ import os
 
 import pandas as pd
 
+from ..utils.dtypes import get_float_dtype
 
-def load_ett(local_path):
+
+def load_ett(local_path, dtype_policy="default"):
     """Load dataset Electricity Transformer Temperature.
 
     Parameters
@@ -22,6 +24,9 @@ def load_ett(local_path):
     local_path : str,
         The local path of dir saving the raw data of Electricity Transformer Temperature.
 
+    dtype_policy : str,
+        The dtype policy, "compact" parses float columns as float32 rather than float64. See tsdb.load().
+
     Returns
     -------
     data : dict
@@ -43,10 +48,15 @@ def load_ett(local_path):
         "ETTh2.csv",
     ]
 
+    float_dtype = get_float_dtype(dtype_policy)
     data = {}
     for sub_set in sub_datasets:
         file_path = os.path.join(local_path, sub_set)
-        df = pd.read_csv(file_path, index_col="date")
+        dtype = None
+        if float_dtype is not None:
+            columns = pd.read_csv(file_path, nrows=0).columns
+            dtype = {c: float_dtype for c in columns if c != "date"}
+        df = pd.read_csv(file_path, index_col="date", dtype=dtype)
         df.index = pd.to_datetime(df.index)
         df_name = sub_set.split(".csv")[0]
         data[df_name] = df
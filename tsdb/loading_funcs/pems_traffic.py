@@ -12,8 +12,10 @@ import os
 
 import pandas as pd
 
+from ..utils.dtypes import get_float_dtype
 
-def load_pems_traffic(local_path):
+
+def load_pems_traffic(local_path, dtype_policy="default"):
     """Load dataset PeMS Traffic.
 
     Parameters
@@ -21,6 +23,9 @@ def load_pems_traffic(local_path):
     local_path : str,
         The local path of dir saving the raw data of PeMS Traffic.
 
+    dtype_policy : str,
+        The dtype policy, "compact" parses float columns as float32 rather than float64. See tsdb.load().
+
     Returns
     -------
     data : dict
@@ -32,7 +37,12 @@ def load_pems_traffic(local_path):
 
     # make columns names
     col_names = [str(i) for i in range(862)]
-    df = pd.read_csv(dir_path, index_col=None, names=col_names)
+    df = pd.read_csv(
+        dir_path,
+        index_col=None,
+        names=col_names,
+        dtype=get_float_dtype(dtype_policy),
+    )
     date = pd.date_range(
         start="2015-01-01 00:00:00",
         end="2016-12-31 23:00:00",
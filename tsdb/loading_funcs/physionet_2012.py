@@ -13,10 +13,11 @@ import os
 
 import pandas as pd
 
+from ..utils.dtypes import downcast_frame, get_float_dtype
 from ..utils.logging import logger
 
 
-def load_physionet2012(local_path):
+def load_physionet2012(local_path, dtype_policy="default"):
     """Load dataset PhysioNet Challenge 2012, which is a time-series classification dataset.
 
     Parameters
@@ -24,6 +25,10 @@ def load_physionet2012(local_path):
     local_path : str,
         The local path of dir saving the raw data of PhysioNet Challenge 2012.
 
+    dtype_policy : str,
+        The dtype policy, "compact" downcasts each sample's float columns to float32 and integer columns to nullable
+        integers while parsing, before the samples are concatenated. See tsdb.load().
+
     Returns
     -------
     data : dict
@@ -58,6 +63,7 @@ def load_physionet2012(local_path):
         outcome_collector.append(outcome)
 
     # iterate over all samples
+    float_dtype = get_float_dtype(dtype_policy)
     set_collector = []
     for m_ in time_series_measurements_dir:
         df_collector = []
@@ -65,7 +71,9 @@ def load_physionet2012(local_path):
         for filename in os.listdir(raw_data_dir):
             recordID = int(filename.split(".txt")[0])
             with open(os.path.join(raw_data_dir, filename), "r") as f:
-                df_temp = pd.read_csv(f)
+                df_temp = pd.read_csv(
+                    f, dtype=None if float_dtype is None else {"Value": float_dtype}
+                )
             df_temp["Time"] = df_temp["Time"].apply(lambda x: int(x.split(":")[0]))
             df_temp = df_temp.pivot_table("Value", "Time", "Parameter")
             df_temp = df_temp.reset_index()  # take Time from index as a col
@@ -78,7 +86,7 @@ def load_physionet2012(local_path):
             df_temp["RecordID"] = recordID
             df_temp["Age"] = df_temp.loc[0, "Age"]
             df_temp["Height"] = df_temp.loc[0, "Height"]
-            df_collector.append(df_temp)
+            df_collector.append(downcast_frame(df_temp, dtype_policy))
         df = pd.concat(df_collector, sort=True)
         set_collector.append(df)
 
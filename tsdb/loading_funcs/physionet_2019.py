@@ -13,8 +13,10 @@ import os
 
 import pandas as pd
 
+from ..utils.dtypes import downcast_frame
 
-def load_physionet2019(local_path):
+
+def load_physionet2019(local_path, dtype_policy="default"):
     time_series_measurements_dir = ["training", "training_setB"]
     # label_feature = "SepsisLabel"  # feature SepsisLabel contains labels indicating whether patients get sepsis
     # time_feature = "ICULOS"  # ICU length-of-stay (hours since ICU admit)
@@ -28,7 +30,7 @@ def load_physionet2019(local_path):
             with open(os.path.join(raw_data_dir, filename), "r") as f:
                 df_temp = pd.read_csv(f, sep="|", header=0)
             df_temp["RecordID"] = recordID
-            df_collector.append(df_temp)
+            df_collector.append(downcast_frame(df_temp, dtype_policy))
         df = pd.concat(df_collector, sort=True)
         set_collector.append(df)
 
@@ -14,8 +14,10 @@ import os
 
 import pandas as pd
 
+from ..utils.dtypes import get_float_dtype
 
-def load_solar_alabama(local_path):
+
+def load_solar_alabama(local_path, dtype_policy="default"):
     """Load dataset Solar Alabama.
 
     Parameters
@@ -23,6 +25,9 @@ def load_solar_alabama(local_path):
     local_path : str,
         The local path of dir saving the raw data of Solar Alabama.
 
+    dtype_policy : str,
+        The dtype policy, "compact" parses float columns as float32 rather than float64. See tsdb.load().
+
     Returns
     -------
     data : dict
@@ -34,7 +39,12 @@ def load_solar_alabama(local_path):
 
     # make columns names
     col_names = [str(i) for i in range(137)]
-    df = pd.read_csv(dir_path, index_col=None, names=col_names)
+    df = pd.read_csv(
+        dir_path,
+        index_col=None,
+        names=col_names,
+        dtype=get_float_dtype(dtype_policy),
+    )
     date = pd.date_range(
         start="2006-01-01 00:00:00",
         end="2006-12-31 23:50:00",
@@ -13,12 +13,15 @@ https://github.com/WenjieDu/TSDB/tree/main/dataset_profiles/ucr_uea_datasets
 
 import os
 import warnings
+from typing import Optional
 
 import numpy as np
 from sklearn.utils.estimator_checks import _NotAnArray as NotAnArray
 
+from ..utils.dtypes import encode_labels
 
-def load_ucr_uea_dataset(local_path, dataset_name):
+
+def load_ucr_uea_dataset(local_path, dataset_name, dtype_policy="default"):
     try:
         # if both TXT and ARFF files are provided, the TXT versions are
         # used
@@ -52,6 +55,11 @@ def load_ucr_uea_dataset(local_path, dataset_name):
             "X_test": X_test,
             "y_test": y_test,
         }
+        if dtype_policy == "compact" and y_train.dtype.kind in "UO":
+            # string labels are encoded as integer codes, and y_classes maps the codes back to the labels
+            (data["y_train"], data["y_test"]), data["y_classes"] = encode_labels(
+                y_train, y_test
+            )
 
         return data
 
@@ -89,6 +97,30 @@ def _has_files(data_dir, dataset_name, ext):
     )
 
 
+def select_ucr_uea_members(member_names: list, dataset_name: str) -> Optional[list]:
+    """Select the members of the dataset's archive read by load_ucr_uea_dataset(), i.e. the training and test files
+    in the format it prefers, so that the other formats (e.g. .ts copies) are never extracted.
+
+    Parameters
+    ----------
+    member_names : list
+        Names of the members in the archive.
+    dataset_name : str
+        The name of the dataset, e.g. "Wine".
+
+    Returns
+    -------
+    list or None
+        Names of the selected members, or None if the archive does not provide both training and test data in
+        ARFF or TXT, then all members are extracted
+    """
+    for ext in ["arff", "txt"]:
+        members = [f"{dataset_name}_{split}.{ext}" for split in ["TRAIN", "TEST"]]
+        if all(member in member_names for member in members):
+            return members
+    return None
+
+
 def ts_size(ts):
     """Returns actual time series size.
 
@@ -0,0 +1,222 @@
+"""
+A content-addressed store of downloaded files, keyed by their SHA-256 digests.
+"""
+
+# Created by Wenjie Du <wenjay.du@gmail.com>
+# License: BSD-3-Clause
+
+import json
+import os
+import shutil
+from typing import Optional
+
+from .locking import FileLock, get_lock_path
+from .logging import logger
+from ..database import CHECKSUMS
+
+# the hidden dir next to dataset dirs holding the store
+BLOB_STORE_DIR_NAME = ".blobs"
+# the file in the store mapping download links to the digests, sizes, and validators of their files
+INDEX_NAME = "index.json"
+# keys of the validators recorded in index entries, as in entries of download manifests
+VALIDATOR_KEYS = ["source", "etag", "last_modified"]
+
+
+def get_blob_store_dir(dataset_saving_path: str) -> str:
+    """Get the store shared by the given dataset dir and its siblings, e.g. `tsdb_home/.blobs` for datasets
+    in tsdb_home. Being on the same device as the dataset dirs, blobs can be hard linked into them.
+
+    Parameters
+    ----------
+    dataset_saving_path :
+        The path of a dataset dir.
+
+    Returns
+    -------
+    blob_store_dir :
+        The path of the store.
+
+    """
+    dataset_saving_path = os.path.abspath(dataset_saving_path)
+    return os.path.join(os.path.dirname(dataset_saving_path), BLOB_STORE_DIR_NAME)
+
+
+def _get_blob_path(blob_store_dir: str, sha256: str) -> str:
+    # blobs are spread over subdirs by the first two hex digits, keeping dirs small
+    return os.path.join(blob_store_dir, "sha256", sha256[:2], sha256)
+
+
+def _read_index(blob_store_dir: str) -> dict:
+    try:
+        with open(os.path.join(blob_store_dir, INDEX_NAME), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_index(blob_store_dir: str, index: dict) -> None:
+    index_path = os.path.join(blob_store_dir, INDEX_NAME)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, index_path)
+
+
+def find_blob(blob_store_dir: str, url: str) -> Optional[str]:
+    """Find the stored file of the given download link, by its expected digest in tsdb.database.CHECKSUMS if any,
+    otherwise by the digest recorded in the index when it was stored.
+
+    Parameters
+    ----------
+    blob_store_dir :
+        The path of the store.
+
+    url :
+        The download link.
+
+    Returns
+    -------
+    blob_path :
+        The path of the stored file, or None if it is not stored.
+
+    """
+    sha256 = CHECKSUMS.get(url, {}).get("sha256")
+    size = CHECKSUMS.get(url, {}).get("size")
+    if sha256 is None:
+        entry = _read_index(blob_store_dir).get(url)
+        if entry is None:
+            return None
+        sha256, size = entry["sha256"], entry["size"]
+    blob_path = _get_blob_path(blob_store_dir, sha256)
+    if not os.path.isfile(blob_path):
+        return None
+    if size is not None and os.path.getsize(blob_path) != size:
+        # hard links of the blob in dataset dirs may have been modified in place
+        logger.warning(f"‼️ The stored file {blob_path} is corrupted, dropping it.")
+        os.remove(blob_path)
+        return None
+    return blob_path
+
+
+def get_blob_validators(blob_store_dir: str, url: str) -> dict:
+    """Get the validators recorded when the file of the given download link was stored, i.e. the url it was
+    downloaded from and its ETag and Last-Modified, for refreshing the file restored from the store.
+
+    Parameters
+    ----------
+    blob_store_dir :
+        The path of the store.
+
+    url :
+        The download link.
+
+    Returns
+    -------
+    validators :
+        The recorded validators, empty if the file is not stored or stored without them.
+
+    """
+    entry = _read_index(blob_store_dir).get(url, {})
+    return {key: entry[key] for key in VALIDATOR_KEYS if key in entry}
+
+
+def put_blob(
+    blob_store_dir: str,
+    url: str,
+    file_path: str,
+    sha256: str,
+    validators: dict = None,
+) -> str:
+    """Move the downloaded file of the given link into the store. Files of identical contents are stored once,
+    so the given file is deleted if its digest is stored already.
+
+    Parameters
+    ----------
+    blob_store_dir :
+        The path of the store.
+
+    url :
+        The download link of the file.
+
+    file_path :
+        The path of the downloaded file.
+
+    sha256 :
+        The SHA-256 digest of the file.
+
+    validators :
+        The url the file was downloaded from and its ETag and Last-Modified, recorded in the index,
+        see get_blob_validators().
+
+    Returns
+    -------
+    blob_path :
+        The path of the stored file.
+
+    """
+    blob_path = _get_blob_path(blob_store_dir, sha256)
+    size = os.path.getsize(file_path)
+    with FileLock(get_lock_path(blob_store_dir)):
+        if os.path.isfile(blob_path) and os.path.getsize(blob_path) == size:
+            os.remove(file_path)
+        else:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            # a rename if the file is on the same device, otherwise a copy
+            shutil.move(file_path, blob_path)
+        index = _read_index(blob_store_dir)
+        index[url] = {"sha256": sha256, "size": size}
+        index[url].update(
+            {
+                key: value
+                for key, value in (validators or {}).items()
+                if key in VALIDATOR_KEYS
+            }
+        )
+        _write_index(blob_store_dir, index)
+    return blob_path
+
+
+def evict_blobs(blob_store_dir: str, bytes_to_free: int) -> int:
+    """Delete stored files not hard linked into any dataset dir, e.g. archives whose contents have been extracted,
+    the least recently stored first, until the given bytes are freed. Files linked into dataset dirs are kept,
+    deleting them frees no space.
+
+    Parameters
+    ----------
+    blob_store_dir :
+        The path of the store.
+
+    bytes_to_free :
+        The bytes to free.
+
+    Returns
+    -------
+    freed_bytes :
+        The bytes freed.
+
+    """
+    if not os.path.isdir(blob_store_dir):
+        return 0
+    with FileLock(get_lock_path(blob_store_dir)):
+        blobs = []
+        for root, _, files in os.walk(os.path.join(blob_store_dir, "sha256")):
+            for f in files:
+                stat = os.stat(os.path.join(root, f))
+                if stat.st_nlink == 1:
+                    blobs.append(
+                        (stat.st_mtime, stat.st_size, f, os.path.join(root, f))
+                    )
+        blobs.sort()
+
+        freed_bytes, evicted = 0, set()
+        for _, size, sha256, blob_path in blobs:
+            if freed_bytes >= bytes_to_free:
+                break
+            os.remove(blob_path)
+            freed_bytes += size
+            evicted.add(sha256)
+        if len(evicted) > 0:
+            index = _read_index(blob_store_dir)
+            index = {url: e for url, e in index.items() if e["sha256"] not in evicted}
+            _write_index(blob_store_dir, index)
+    return freed_bytes
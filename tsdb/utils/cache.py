@@ -0,0 +1,744 @@
+"""
+Functions for saving and loading the processed cache of datasets.
+"""
+
+# Created by Wenjie Du <wenjay.du@gmail.com>
+# License: BSD-3-Clause
+
+import json
+import os
+import pickle
+import re
+import shutil
+from collections.abc import Mapping
+from contextlib import nullcontext
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from .file import pickle_dump, pickle_load, create_dir_if_not_exist
+from .locking import FileLock
+from .logging import logger
+from ..version import __version__
+
+CACHE_FORMATS = ["pickle", "parquet", "feather"]
+COLUMNAR_FILE_SUFFIX = {
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+MANIFEST_NAME = "manifest.json"
+OBJECTS_NAME = "objects.pkl"
+COMPRESSIONS = ["none", "lz4", "zstd"]
+# magic numbers of the frame formats written by pyarrow's compressed streams
+_COMPRESSION_MAGIC = {
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"\x04\x22\x4d\x18": "lz4",
+}
+# the column of partition files holding the positions of their rows in the partitioned frame
+_ROW_POSITION_COLUMN = "__tsdb_row_position__"
+
+
+def get_cache_path(
+    dataset_saving_path: str,
+    dataset_name: str,
+    cache_format: str,
+    dtype_policy: str = "default",
+) -> str:
+    """Get the path of the processed cache of the given dataset.
+
+    Parameters
+    ----------
+    dataset_saving_path :
+        The local path of the dataset dir.
+
+    dataset_name :
+        The name of the dataset.
+
+    cache_format :
+        The format of the cache, should be one of CACHE_FORMATS.
+
+    dtype_policy :
+        The dtype policy of the cached values, should be one of DTYPE_POLICIES.
+        Non-default policies get their own caches, e.g. "<dataset_name>_compact_cache.pkl".
+
+    Returns
+    -------
+    cache_path :
+        A pickle file if `cache_format` is "pickle", otherwise a directory holding one file per value plus a manifest.
+
+    """
+    assert (
+        cache_format in CACHE_FORMATS
+    ), f"cache_format should be one of {CACHE_FORMATS}, but got {cache_format}"
+
+    if dtype_policy != "default":
+        dataset_name = f"{dataset_name}_{dtype_policy}"
+    if cache_format == "pickle":
+        return os.path.join(dataset_saving_path, dataset_name + "_cache.pkl")
+    return os.path.join(dataset_saving_path, f"{dataset_name}_cache_{cache_format}")
+
+
+def is_cache_path(path: str) -> bool:
+    """Whether the given file or directory name is a processed cache generated by TSDB,
+    including the temporary ones left by interrupted writes."""
+    name = os.path.basename(path)
+    if name.endswith(".tmp") or name.endswith(".old"):
+        name = name.rsplit(".", 2)[0]
+    return name.endswith(".pkl") or any(
+        name.endswith(f"_cache_{f}") for f in COLUMNAR_FILE_SUFFIX.keys()
+    )
+
+
+def _file_name(key: str, suffix: str) -> str:
+    # keys of the result dict are given by the loading functions, sanitize them anyway to be safe file names
+    return re.sub(r"[^\w.-]", "_", str(key)) + suffix
+
+
+def _is_json_serializable(value) -> bool:
+    # values like tuples can be dumped but not restored as they were, hence check the round trip
+    try:
+        return json.loads(json.dumps(value)) == value
+    except (TypeError, ValueError):
+        return False
+
+
+def save_cache(
+    result: dict,
+    cache_path: str,
+    cache_format: str,
+    compression: str = "none",
+    compression_level: int = None,
+    partition_key: str = None,
+    partition_rows: int = 100000,
+    row_group_rows: int = 65536,
+) -> None:
+    """Save the processed dataset into the cache with the given format.
+    The cache is written to a temporary path and then renamed, so concurrent readers never see a partial cache.
+
+    Parameters
+    ----------
+    result :
+        The processed dataset returned by a loading function.
+
+    cache_path :
+        The path returned by `get_cache_path()`.
+
+    cache_format :
+        The format of the cache, should be one of CACHE_FORMATS.
+
+    compression :
+        The codec compressing the cache, should be one of COMPRESSIONS. It is applied to the pickle file and to the
+        parquet/feather files, but not to .npy files that have to stay memory-mappable.
+
+    compression_level :
+        The compression level of the codec, the codec's default level if not given. It is ignored if `compression` is
+        "none". The pickle file is compressed as a stream, which only supports the default level.
+
+    partition_key :
+        The column identifying entities, e.g. "RecordID" of physionet patients. DataFrame values holding it are saved
+        by parquet/feather caches as partition files of about `partition_rows` rows each plus a partition index, and
+        each entity's rows stay in one partition. Then loading a subset of entities or partitions only reads the
+        relevant files.
+
+    partition_rows :
+        The number of rows per partition file. An entity with more rows gets a partition of its own.
+
+    row_group_rows :
+        The number of rows per row group of parquet files. Row groups that cannot match the filters of
+        `load_cache()` are skipped with their statistics, so smaller groups skip more rows but compress worse.
+
+    """
+    assert (
+        compression in COMPRESSIONS
+    ), f"compression should be one of {COMPRESSIONS}, but got {compression}"
+
+    if compression == "none":
+        # pyarrow refuses a compression level without a codec
+        compression_level = None
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    if cache_format == "pickle":
+        if compression == "none":
+            pickle_dump(result, tmp_path)
+        else:
+            _pickle_dump_compressed(result, tmp_path, compression)
+    else:
+        try:
+            _save_columnar_cache(
+                result,
+                tmp_path,
+                cache_format,
+                compression,
+                compression_level,
+                partition_key,
+                partition_rows,
+                row_group_rows,
+            )
+        except Exception:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+    if not os.path.exists(tmp_path):
+        # saving failed and has been logged
+        return
+    if os.path.isdir(cache_path):
+        # a non-empty dir cannot be replaced in one rename, move the old one aside first
+        old_path = f"{cache_path}.{os.getpid()}.old"
+        os.rename(cache_path, old_path)
+        os.rename(tmp_path, cache_path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    else:
+        os.replace(tmp_path, cache_path)
+    logger.info(f"Successfully saved to {cache_path}")
+
+
+def _pickle_dump_compressed(result: dict, path: str, compression: str) -> None:
+    try:
+        with pa.CompressedOutputStream(path, compression) as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        logger.error(
+            f"❌ Pickling failed. No cache data saved. Investigate the error below: \n{e}"
+        )
+
+
+def _get_pickle_compression(path: str) -> str:
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    return _COMPRESSION_MAGIC.get(magic, "none")
+
+
+def _pickle_load_compressed(path: str, compression: str) -> object:
+    try:
+        with pa.CompressedInputStream(pa.OSFile(path), compression) as f:
+            data = pickle.load(f)
+    except Exception as e:
+        logger.error(
+            f"❌ Loading data failed. Operation aborted. Investigate the error below: \n{e}"
+        )
+        return None
+
+    return data
+
+
+def _write_table(
+    table: pa.Table,
+    file_path: str,
+    cache_format: str,
+    compression: str,
+    compression_level: int,
+    row_group_rows: int,
+) -> None:
+    if cache_format == "parquet":
+        pq.write_table(
+            table,
+            file_path,
+            row_group_size=row_group_rows,
+            compression=compression,
+            compression_level=compression_level,
+        )
+    else:
+        feather.write_feather(
+            table,
+            file_path,
+            compression="uncompressed" if compression == "none" else compression,
+            compression_level=compression_level,
+        )
+
+
+def _partition_frame(
+    df: pd.DataFrame,
+    dir_name: str,
+    cache_format: str,
+    partition_key: str,
+    partition_rows: int,
+) -> Tuple[list, dict]:
+    # entities are assigned to partitions in the order of their first appearance, each partition starts with the
+    # entity crossing its row boundary. Rows of interleaved entities are grouped into their partitions, so the
+    # positions of rows in the frame are stored with them, and rows read from several partitions are sorted back
+    codes, entities = pd.factorize(df[partition_key], use_na_sentinel=False)
+    counts = np.bincount(codes, minlength=len(entities))
+    start_rows = np.cumsum(counts) - counts
+    _, entity_partitions = np.unique(start_rows // partition_rows, return_inverse=True)
+    row_partitions = entity_partitions[codes]
+    row_order = np.argsort(row_partitions, kind="stable")
+    boundaries = np.searchsorted(
+        row_partitions[row_order], np.arange(entity_partitions.max() + 2)
+    )
+
+    tables, partitions = [], []
+    for i in range(len(boundaries) - 1):
+        part = df.iloc[row_order[boundaries[i] : boundaries[i + 1]]]
+        file_name = f"{dir_name}/part-{i:05d}{COLUMNAR_FILE_SUFFIX[cache_format]}"
+        # the index is always stored as columns, so that the schemas of all partitions are the same
+        table = pa.Table.from_pandas(part, preserve_index=True)
+        table = table.append_column(
+            _ROW_POSITION_COLUMN,
+            pa.array(row_order[boundaries[i] : boundaries[i + 1]], pa.int64()),
+        )
+        tables.append((file_name, table))
+        partitions.append(
+            {
+                "file": file_name,
+                "num_rows": len(part),
+                "entities": entities[entity_partitions == i].tolist(),
+            }
+        )
+    entry = {
+        "type": "DataFrame",
+        "partition_key": partition_key,
+        "partitions": partitions,
+    }
+    return tables, entry
+
+
+def _save_columnar_cache(
+    result: dict,
+    cache_path: str,
+    cache_format: str,
+    compression: str,
+    compression_level: int,
+    partition_key: str = None,
+    partition_rows: int = 100000,
+    row_group_rows: int = 65536,
+) -> None:
+    suffix = COLUMNAR_FILE_SUFFIX[cache_format]
+    create_dir_if_not_exist(cache_path)
+
+    manifest = {
+        "tsdb_version": __version__,
+        "cache_format": cache_format,
+        "compression": compression,
+        "keys": {},
+    }
+    objects = {}
+    for key, value in result.items():
+        entry = None
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            is_series = isinstance(value, pd.Series)
+            df = value.to_frame(name="__series__") if is_series else value
+            try:
+                if not is_series and partition_key in df.columns and len(df) > 0:
+                    tables, entry = _partition_frame(
+                        df,
+                        _file_name(key, ""),
+                        cache_format,
+                        partition_key,
+                        partition_rows,
+                    )
+                else:
+                    file_name = _file_name(key, suffix)
+                    # the index is stored as columns, so that rows selected by filters keep their labels
+                    tables = [
+                        (file_name, pa.Table.from_pandas(df, preserve_index=True))
+                    ]
+                    entry = {
+                        "type": "Series" if is_series else "DataFrame",
+                        "file": file_name,
+                    }
+                    if is_series:
+                        entry["name"] = value.name
+            except (
+                pa.ArrowInvalid,
+                pa.ArrowTypeError,
+                pa.ArrowNotImplementedError,
+            ) as e:
+                # e.g. mixed-type object columns cannot be converted, fall back to pickle.
+                # Failing to write the converted tables is an error instead, e.g. with a bad compression option
+                logger.warning(
+                    f"‼️ Failed to save {key} in {cache_format} format, pickling it instead. Reason: {e}"
+                )
+            else:
+                for file_name, table in tables:
+                    file_path = os.path.join(cache_path, file_name)
+                    create_dir_if_not_exist(os.path.dirname(file_path))
+                    _write_table(
+                        table,
+                        file_path,
+                        cache_format,
+                        compression,
+                        compression_level,
+                        row_group_rows,
+                    )
+                if isinstance(df.index, pd.RangeIndex):
+                    # restored when no row is filtered out, a RangeIndex takes no memory per row
+                    entry["range_index"] = [
+                        df.index.start,
+                        df.index.stop,
+                        df.index.step,
+                    ]
+        elif isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            # plain arrays are saved as .npy files, which can be memory-mapped when loading
+            file_name = _file_name(key, ".npy")
+            np.save(os.path.join(cache_path, file_name), value, allow_pickle=False)
+            entry = {"type": "ndarray", "file": file_name}
+        elif _is_json_serializable(value):
+            entry = {"type": "json", "value": value}
+
+        if entry is None:
+            objects[key] = value
+            entry = {"type": "object"}
+        manifest["keys"][key] = entry
+
+    if len(objects) > 0:
+        pickle_dump(objects, os.path.join(cache_path, OBJECTS_NAME))
+
+    # the manifest is written at last, a cache dir without it is incomplete and will be ignored
+    with open(os.path.join(cache_path, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def _read_manifest(cache_path: str) -> dict:
+    with open(os.path.join(cache_path, MANIFEST_NAME), "r") as f:
+        manifest = json.load(f)
+    return manifest
+
+
+def _get_filter_columns(filters: list) -> list:
+    # filters can be a list of (column, op, value) tuples or a list of such lists
+    predicates = (
+        filters if isinstance(filters[0][0], str) else [p for f in filters for p in f]
+    )
+    filter_columns = []
+    for column, _, _ in predicates:
+        if column not in filter_columns:
+            filter_columns.append(column)
+    return filter_columns
+
+
+def _and_filters(filters: list, predicate: tuple) -> list:
+    # add the predicate to each conjunction of the filters in the disjunctive normal form
+    if isinstance(filters[0][0], str):
+        return list(filters) + [predicate]
+    return [list(f) + [predicate] for f in filters]
+
+
+def _restore_range_index(frame: pd.DataFrame, range_index: list) -> pd.DataFrame:
+    index = pd.RangeIndex(*range_index, name=frame.index.name)
+    if len(frame) == len(index) and frame.index.equals(index):
+        frame.index = index
+    return frame
+
+
+class LazyDataset(Mapping):
+    """A read-only dict-like handle of a parquet/feather cache.
+    Each value is read from its own file in the cache on the first access and then retained,
+    so only the keys touched are materialized.
+
+    Parameters
+    ----------
+    cache_path :
+        The path returned by `get_cache_path()`.
+
+    cache_format :
+        The format of the cache, should be "parquet" or "feather".
+
+    mmap :
+        Whether to open ndarray values as read-only memory maps instead of reading them into memory.
+
+    columns :
+        Names of the columns to read from DataFrame values. Columns not in a DataFrame are ignored, and its index is
+        always kept. Unselected columns are never read from the disk.
+
+    filters :
+        Row filters in pyarrow's disjunctive normal form, e.g. [("station", "=", "Aoti")], see the argument `filters`
+        of pyarrow.parquet.read_table(). They are applied to the DataFrame values holding all the columns referenced.
+        Parquet caches skip row groups with their statistics, feather caches are filtered after reading.
+        An empty list filters out no row, like None.
+
+    entities :
+        Keys of the entities to read from partitioned DataFrame values, e.g. RecordIDs of physionet patients.
+        Only the partition files holding them are read.
+
+    partitions :
+        Indices of the partitions to read from partitioned DataFrame values, e.g. one partition per worker.
+        Indices beyond the number of partitions of a value are ignored.
+
+    lock_path :
+        The lock file guarding the dataset dir of the cache, whose shared lock is taken while reading values,
+        so that other processes do not purge or evict the cache in the middle.
+
+    """
+
+    def __init__(
+        self,
+        cache_path: str,
+        cache_format: str,
+        mmap: bool = False,
+        columns: list = None,
+        filters: list = None,
+        entities: list = None,
+        partitions: list = None,
+        lock_path: str = None,
+    ):
+        assert (
+            cache_format in COLUMNAR_FILE_SUFFIX.keys()
+        ), f"LazyDataset only works with {list(COLUMNAR_FILE_SUFFIX.keys())} caches, but got {cache_format}"
+
+        self.cache_path = cache_path
+        self.cache_format = cache_format
+        self.mmap = mmap
+        self.columns = columns
+        # pyarrow takes no empty disjunction, and no row is filtered out by it anyway
+        self.filters = filters if filters else None
+        self.entities = entities
+        self.partitions = partitions
+        self.lock_path = lock_path
+        self._entries = _read_manifest(cache_path)["keys"]
+        self._values = {}
+        self._objects = None
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            entry = self._entries[key]
+            lock = (
+                FileLock(self.lock_path, shared=True)
+                if self.lock_path is not None
+                else nullcontext()
+            )
+            with lock:
+                self._values[key] = self._load_value(key, entry)
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return (
+            f"LazyDataset(keys={list(self._entries.keys())}, "
+            f"loaded={list(self._values.keys())}, cache_path={self.cache_path})"
+        )
+
+    @property
+    def loaded_keys(self) -> list:
+        """Keys whose values have been materialized."""
+        return list(self._values.keys())
+
+    def _read_table(self, file_path: str, columns: list, filters: list) -> pa.Table:
+        if self.cache_format == "parquet":
+            schema = pq.read_schema(file_path)
+        else:
+            schema = pa.ipc.open_file(pa.memory_map(file_path)).schema
+
+        filter_columns = []
+        if columns is not None:
+            # the index is stored as columns too, keep it
+            index_columns = [
+                c for c in schema.pandas_metadata["index_columns"] if isinstance(c, str)
+            ]
+            columns = [c for c in columns if c in schema.names] + index_columns
+        if filters is not None:
+            filter_columns = _get_filter_columns(filters)
+            if not all(c in schema.names for c in filter_columns):
+                filters = None
+
+        if self.cache_format == "parquet":
+            table = pq.read_table(
+                file_path,
+                columns=columns,
+                filters=filters,
+                use_threads=True,
+                use_pandas_metadata=True,
+            )
+        else:
+            # feather files have no statistics for skipping, read the columns needed and filter them
+            read_columns = columns
+            if columns is not None and filters is not None:
+                read_columns = columns + [c for c in filter_columns if c not in columns]
+            table = feather.read_table(
+                file_path, columns=read_columns, use_threads=True, memory_map=True
+            )
+            if filters is not None:
+                table = table.filter(pq.filters_to_expression(filters))
+                if columns is not None:
+                    table = table.select(columns)
+        return table
+
+    def _read_partitions(self, entry: dict) -> pa.Table:
+        partitions = entry["partitions"]
+        if self.partitions is not None:
+            selected = set(self.partitions)
+            partitions = [p for i, p in enumerate(partitions) if i in selected]
+        filters = self.filters
+        if self.entities is not None:
+            entities = set(self.entities)
+            partitions = [
+                p for p in partitions if not entities.isdisjoint(p["entities"])
+            ]
+            predicate = (entry["partition_key"], "in", list(entities))
+            filters = (
+                [predicate] if filters is None else _and_filters(filters, predicate)
+            )
+
+        columns = self.columns
+        if columns is not None:
+            columns = columns + [_ROW_POSITION_COLUMN]
+        if len(partitions) == 0:
+            # nothing selected, keep the schema of the frame
+            file_path = os.path.join(self.cache_path, entry["partitions"][0]["file"])
+            table = self._read_table(file_path, columns, filters).slice(0, 0)
+        else:
+            table = pa.concat_tables(
+                [
+                    self._read_table(
+                        os.path.join(self.cache_path, p["file"]), columns, filters
+                    )
+                    for p in partitions
+                ]
+            )
+        if _ROW_POSITION_COLUMN in table.column_names:
+            if len(partitions) > 1:
+                table = table.sort_by(_ROW_POSITION_COLUMN)
+            table = table.remove_column(
+                table.schema.get_field_index(_ROW_POSITION_COLUMN)
+            )
+        return table
+
+    def _load_value(self, key: str, entry: dict):
+        if "partitions" in entry:
+            table = self._read_partitions(entry)
+            value = table.to_pandas(split_blocks=True, self_destruct=True)
+            if entry.get("range_index") is not None:
+                value = _restore_range_index(value, entry["range_index"])
+        elif entry["type"] in ["DataFrame", "Series"]:
+            file_path = os.path.join(self.cache_path, entry["file"])
+            if entry["type"] == "DataFrame":
+                table = self._read_table(file_path, self.columns, self.filters)
+            else:
+                table = self._read_table(file_path, None, None)
+            # split_blocks and self_destruct avoid consolidating columns into a second full copy
+            value = table.to_pandas(split_blocks=True, self_destruct=True)
+            if entry.get("range_index") is not None:
+                value = _restore_range_index(value, entry["range_index"])
+            if entry["type"] == "Series":
+                value = value["__series__"].rename(entry["name"])
+        elif entry["type"] == "ndarray":
+            value = np.load(
+                os.path.join(self.cache_path, entry["file"]),
+                mmap_mode="r" if self.mmap else None,
+                allow_pickle=False,
+            )
+        elif entry["type"] == "json":
+            value = entry["value"]
+        else:
+            if self._objects is None:
+                self._objects = pickle_load(os.path.join(self.cache_path, OBJECTS_NAME))
+            value = self._objects[key]
+        return value
+
+
+def load_cache(
+    cache_path: str,
+    cache_format: str,
+    mmap: bool = False,
+    lazy: bool = False,
+    columns: list = None,
+    filters: list = None,
+    entities: list = None,
+    partitions: list = None,
+    lock_path: str = None,
+) -> Union[dict, LazyDataset]:
+    """Load the processed dataset from the cache with the given format.
+    Columnar files are read with pyarrow's multithreaded readers.
+
+    Parameters
+    ----------
+    cache_path :
+        The path returned by `get_cache_path()`.
+
+    cache_format :
+        The format of the cache, should be one of CACHE_FORMATS.
+
+    mmap :
+        Whether to open ndarray values as read-only memory maps instead of reading them into memory.
+        Only works for "parquet" and "feather" caches, in which ndarray values are saved as .npy files.
+
+    lazy :
+        Whether to return a LazyDataset reading values on first access rather than a dict holding all of them.
+        Only works for "parquet" and "feather" caches.
+
+    columns :
+        Names of the columns to read from DataFrame values, see LazyDataset.
+        Only works for "parquet" and "feather" caches.
+
+    filters :
+        Row filters applied to DataFrame values, see LazyDataset.
+        Only works for "parquet" and "feather" caches.
+
+    entities :
+        Keys of the entities to read from partitioned DataFrame values, see LazyDataset.
+        Only works for "parquet" and "feather" caches.
+
+    partitions :
+        Indices of the partitions to read from partitioned DataFrame values, see LazyDataset.
+        Only works for "parquet" and "feather" caches.
+
+    lock_path :
+        The lock file guarding the dataset dir of the cache, whose shared lock is taken while reading values, see
+        LazyDataset. Only works for "parquet" and "feather" caches, callers reading a pickle cache take it themselves.
+
+    Returns
+    -------
+    result :
+        The processed dataset in a Python dict, or a LazyDataset if `lazy` is True.
+
+    """
+    if cache_format == "pickle":
+        compression = _get_pickle_compression(cache_path)
+        if compression == "none":
+            return pickle_load(cache_path)
+        return _pickle_load_compressed(cache_path, compression)
+
+    lazy_dataset = LazyDataset(
+        cache_path,
+        cache_format,
+        mmap,
+        columns,
+        filters,
+        entities,
+        partitions,
+        lock_path,
+    )
+    if lazy:
+        return lazy_dataset
+    result = {key: lazy_dataset[key] for key in lazy_dataset}
+    return result
+
+
+def read_partition_index(cache_path: str) -> dict:
+    """Read the partition index of a parquet/feather cache.
+
+    Parameters
+    ----------
+    cache_path :
+        The path returned by `get_cache_path()`.
+
+    Returns
+    -------
+    partition_index :
+        The partitions of each partitioned DataFrame value, keyed by the dataset keys. Each partition is a dict
+        holding its `file`, its `num_rows`, and the keys of its `entities`.
+
+    """
+    return {
+        key: entry["partitions"]
+        for key, entry in _read_manifest(cache_path)["keys"].items()
+        if "partitions" in entry
+    }
+
+
+def cache_exists(cache_path: str, cache_format: str) -> bool:
+    """Whether the given cache is complete and can be loaded."""
+    if cache_format == "pickle":
+        return os.path.exists(cache_path)
+    return os.path.exists(os.path.join(cache_path, MANIFEST_NAME))
@@ -26,8 +26,36 @@ def read_configs(config_path: str = PYPOTS_ECOSYSTEM_CONFIG_PATH):
     return config_parser
 
 
+def get_config(section: str, option: str) -> str:
+    """Get the value of the given option from the user's config file.
+    Config files created by older versions of TSDB may lack newly-added options,
+    so the default value from the config template is used in such a case.
+
+    Parameters
+    ----------
+    section :
+        The section name in config.ini, e.g. "path".
+
+    option :
+        The option name in the section, e.g. "tsdb_home".
+
+    Returns
+    -------
+    value :
+        The value of the option in string.
+
+    """
+    config_parser = read_configs()
+    if config_parser.has_option(section, option):
+        return config_parser.get(section, option)
+    return read_configs(CONFIG_TEMPLATE_PATH).get(section, option)
+
+
 def write_configs(config_parser, key_value_set):
     for section in key_value_set.keys():
+        # config files created by older versions of TSDB may lack newly-added sections
+        if not config_parser.has_section(section):
+            config_parser.add_section(section)
         for key in key_value_set[section].keys():
             value = key_value_set[section][key]
             config_parser.set(section, key, value)
@@ -6,21 +6,757 @@ Downloading functions.
 # License: BSD-3-Clause
 
 import gzip
+import hashlib
+import json
 import os
 import shutil
-import tempfile
+import tarfile
+import threading
+import time
 import warnings
-from typing import Optional
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from math import ceil
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 
+from .blob_store import (
+    find_blob,
+    get_blob_store_dir,
+    get_blob_validators,
+    put_blob,
+)
+from .config import get_config
+from .executor import LinkedEvent, shutdown_executor
+from .locking import FileLock, get_lock_path
 from .logging import logger
-from ..database import DATABASE
+from ..database import CHECKSUMS, DATABASE
 
+# the hidden dir next to the saving path, where raw files are downloaded before being moved or extracted
+STAGING_DIR_NAME = ".partial"
+# the suffix of the journal of a partial file
+JOURNAL_SUFFIX = ".journal"
+# the file in the dataset dir recording the size, SHA-256 digest, and extracted files of each downloaded link
+MANIFEST_NAME = ".tsdb_manifest.json"
+DOWNLOAD_CHUNK_SIZE = 8192
+HASH_CHUNK_SIZE = 1 << 20
+# tarballs that can be extracted while downloading
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+# gzipped single files that can be decompressed while downloading, e.g. pems_traffic
+GZIP_SUFFIX = ".txt.gz"
+# extraction filter rejecting absolute paths and links out of the target dir, available since Python 3.11.4
+_TAR_EXTRACT_KWARGS = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+# statuses worth retrying, e.g. rate limiting and transient server errors
+RETRY_STATUSES = [429, 500, 502, 503, 504]
 
-def _download_and_extract(url: str, saving_path: str) -> Optional[str]:
+# ways to pick among mirrors, "order" probes them in the configured order, "latency" from the fastest
+MIRROR_SELECTIONS = ["order", "latency"]
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+# measured latencies of HTTP mirrors in seconds, measured once per process
+_mirror_latencies = {}
+# the number of running callers hiding the progress bars of single files, e.g. tsdb.prefetch() showing its own
+_quiet_progress_count = 0
+_quiet_progress_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Get the HTTP session shared by all downloads of the current process.
+
+    Its connections are pooled, so links on the same host (e.g. dozens of UCR/UEA datasets) reuse TCP and TLS
+    connections instead of handshaking for each link. Connection errors and RETRY_STATUSES are retried with
+    exponential backoff. The options are in the section `download` of config.ini: `retries`, `backoff_factor`,
+    and `max_connections_per_host`, beyond which requests to a host wait for a free connection.
+
+    Returns
+    -------
+    session :
+        The shared session.
+
+    """
+    global _session, _session_pid
+    with _session_lock:
+        # connections cannot be shared with forked processes, which get their own session
+        if _session is None or _session_pid != os.getpid():
+            retry = Retry(
+                total=int(get_config("download", "retries")),
+                backoff_factor=float(get_config("download", "backoff_factor")),
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=["GET", "HEAD"],
+                respect_retry_after_header=True,
+                # hand the last response over to raise_for_status() when retries are exhausted
+                raise_on_status=False,
+            )
+            max_connections = int(get_config("download", "max_connections_per_host"))
+            adapter = HTTPAdapter(
+                pool_maxsize=max_connections,
+                pool_block=True,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def _get_timeout() -> Tuple[float, float]:
+    return (
+        float(get_config("download", "connect_timeout")),
+        float(get_config("download", "read_timeout")),
+    )
+
+
+def _get(url: str, headers: dict) -> requests.Response:
+    return get_session().get(url, stream=True, headers=headers, timeout=_get_timeout())
+
+
+def _is_http(url: str) -> bool:
+    return url.startswith(("http://", "https://"))
+
+
+def _get_mirror_latency(mirror: str) -> float:
+    if not _is_http(mirror):
+        return 0.0
+    if mirror not in _mirror_latencies:
+        start = time.perf_counter()
+        try:
+            get_session().head(mirror, timeout=_get_timeout())
+            _mirror_latencies[mirror] = time.perf_counter() - start
+        except requests.RequestException:
+            _mirror_latencies[mirror] = float("inf")
+    return _mirror_latencies[mirror]
+
+
+def get_mirrors() -> list:
+    """Get the mirrors in the section `download` of config.ini, in the order to probe them.
+
+    `mirrors` is a comma-separated list of local dirs, file:// urls, and http(s):// urls. Files are looked up in
+    a mirror by the host and path of their original links, e.g. `<mirror>/www.physionet.org/files/challenge-2012/
+    1.0.0/set-a.tar.gz`, then by their file names directly under the mirror, e.g. `<mirror>/set-a.tar.gz`.
+    With `mirror_selection` being "latency", mirrors are probed from the one with the lowest measured latency,
+    local ones first.
+
+    Returns
+    -------
+    mirrors :
+        The mirrors, empty if none is configured.
+
+    """
+    mirrors = [m.strip() for m in get_config("download", "mirrors").split(",")]
+    mirrors = [m for m in mirrors if len(m) > 0]
+    mirror_selection = get_config("download", "mirror_selection")
+    assert (
+        mirror_selection in MIRROR_SELECTIONS
+    ), f"mirror_selection should be one of {MIRROR_SELECTIONS}, but got {mirror_selection}"
+    if mirror_selection == "latency":
+        mirrors.sort(key=_get_mirror_latency)
+    return mirrors
+
+
+def _resolve_mirror(url: str) -> Optional[str]:
+    """Find the file of the given url in the mirrors.
+    Returns its local path or its url on an HTTP mirror, or None if no mirror has it."""
+    parsed_url = urlparse(url)
+    relative_paths = [
+        parsed_url.netloc + parsed_url.path,
+        os.path.basename(parsed_url.path),
+    ]
+    for mirror in get_mirrors():
+        for relative_path in relative_paths:
+            if _is_http(mirror):
+                mirrored_url = f"{mirror.rstrip('/')}/{relative_path}"
+                try:
+                    with get_session().head(
+                        mirrored_url, allow_redirects=True, timeout=_get_timeout()
+                    ) as r:
+                        found = r.status_code == 200
+                except requests.RequestException as e:
+                    logger.warning(f"‼️ Failed to probe the mirror {mirror}: {e}")
+                    break
+                if found:
+                    return mirrored_url
+            else:
+                mirror_dir = (
+                    url2pathname(urlparse(mirror).path)
+                    if mirror.startswith("file://")
+                    else os.path.expanduser(mirror)
+                )
+                file_path = os.path.join(mirror_dir, *relative_path.split("/"))
+                if os.path.isfile(file_path):
+                    return file_path
+    return None
+
+
+def _link_or_copy(source: str, target: str) -> None:
+    # hard links take neither time nor space, but cannot cross devices
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+@contextmanager
+def quiet_file_progress():
+    """Hide the progress bars of single files within the context, for callers showing an aggregate one."""
+    global _quiet_progress_count
+    with _quiet_progress_lock:
+        _quiet_progress_count += 1
+    try:
+        yield
+    finally:
+        with _quiet_progress_lock:
+            _quiet_progress_count -= 1
+
+
+def get_download_size(dataset_name: str) -> int:
+    """Get the total size in bytes of the files to download for the dataset, without downloading them.
+    Sizes are taken from tsdb.database.CHECKSUMS, local mirrors, or the Content-Length of HEAD requests,
+    and files of unknown sizes count as 0.
+
+    Parameters
+    ----------
+    dataset_name : str,
+        The name of a dataset available in tsdb.
+
+    Returns
+    -------
+    size :
+        The total size in bytes.
+
+    """
+    links = DATABASE[dataset_name]
+    links = links if isinstance(links, list) else [links]
+    total_size = 0
+    for link in links:
+        if CHECKSUMS.get(link, {}).get("size") is not None:
+            total_size += CHECKSUMS[link]["size"]
+            continue
+        source = _resolve_mirror(link)
+        if source is not None and not _is_http(source):
+            total_size += os.path.getsize(source)
+            continue
+        try:
+            with get_session().head(
+                link if source is None else source,
+                allow_redirects=True,
+                headers={"Accept-Encoding": "identity"},
+                timeout=_get_timeout(),
+            ) as r:
+                if r.ok:
+                    total_size += int(r.headers.get("Content-Length", 0))
+        except (requests.RequestException, ValueError):
+            pass
+    return total_size
+
+
+def _get_staging_dir(saving_path: str) -> str:
+    # raw files are downloaded into a hidden sibling of the saving path, kept across failures for resuming,
+    # and being on the same device, moved into the saving path with renames
+    saving_path = os.path.abspath(saving_path)
+    return os.path.join(
+        os.path.dirname(saving_path), STAGING_DIR_NAME, os.path.basename(saving_path)
+    )
+
+
+def _read_journal(journal_path: str) -> Optional[dict]:
+    try:
+        with open(journal_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_journal(journal_path: str, journal: dict) -> None:
+    tmp_path = f"{journal_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(journal, f)
+    os.replace(tmp_path, journal_path)
+
+
+def _remove_partial_file(file_path: str) -> None:
+    for path in [file_path, file_path + JOURNAL_SUFFIX]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _remove_staging_dir(saving_path: str) -> None:
+    # only empty dirs are removed, partial files of failed downloads are kept
+    staging_dir = _get_staging_dir(saving_path)
+    for path in [staging_dir, os.path.dirname(staging_dir)]:
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+
+
+def _get_resume_offset(url: str, file_path: str) -> Tuple[int, dict]:
+    """Get the offset to resume downloading the partial file from, and the journal of it."""
+    journal = _read_journal(file_path + JOURNAL_SUFFIX)
+    if journal is None or journal.get("url") != url or not os.path.exists(file_path):
+        return 0, {}
+    # without a validator there is no telling whether the file on the server has changed since
+    if journal.get("etag") is None and journal.get("last_modified") is None:
+        return 0, {}
+    return os.path.getsize(file_path), journal
+
+
+def _hash_file(file_path: str, hasher=None):
+    """Feed the given file into the hasher, a new SHA-256 one if None, and return it."""
+    hasher = hashlib.sha256() if hasher is None else hasher
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher
+
+
+def _verify_checksum(url: str, size: int, sha256: str) -> None:
+    expected = CHECKSUMS.get(url)
+    if expected is None:
+        return
+    if expected.get("size") is not None and expected["size"] != size:
+        raise RuntimeError(
+            f"{url} is expected to be {expected['size']} bytes, but {size} bytes are downloaded"
+        )
+    if expected.get("sha256") is not None and expected["sha256"] != sha256:
+        raise RuntimeError(
+            f"the SHA-256 digest {sha256} of {url} does not match the expected {expected['sha256']}"
+        )
+
+
+def read_manifest(dataset_saving_path: str) -> dict:
+    """Read the download manifest of the dataset, keyed by download links. Empty if there is none."""
+    manifest = _read_journal(os.path.join(dataset_saving_path, MANIFEST_NAME))
+    return {} if manifest is None else manifest
+
+
+def _is_verified(url: str, entry: Optional[dict], dataset_saving_path: str) -> bool:
+    if entry is None:
+        return False
+    expected = CHECKSUMS.get(url, {})
+    for key in ["size", "sha256"]:
+        if expected.get(key) is not None and expected[key] != entry[key]:
+            return False
+    return all(
+        os.path.exists(os.path.join(dataset_saving_path, name))
+        for name in entry["outputs"]
+    )
+
+
+def verify_download(dataset_name: str, dataset_saving_path: str) -> list:
+    """Check the downloaded files of the dataset against its manifest, without reading them.
+
+    Parameters
+    ----------
+    dataset_name : str,
+        The name of a dataset available in tsdb.
+
+    dataset_saving_path : str,
+        The local path of the downloaded dataset.
+
+    Returns
+    -------
+    unverified_links :
+        Links whose files are missing, or whose recorded digests do not match the expected ones in
+        tsdb.database.CHECKSUMS. Empty if the dataset dir has no manifest, i.e. it was downloaded by an older TSDB.
+
+    """
+    manifest = read_manifest(dataset_saving_path)
+    if len(manifest) == 0:
+        return []
+    links = DATABASE[dataset_name]
+    links = links if isinstance(links, list) else [links]
+    return [
+        link
+        for link in links
+        if not _is_verified(link, manifest.get(link), dataset_saving_path)
+    ]
+
+
+def _get_conditional_headers(entry: dict) -> dict:
+    """Get the headers asking the server to send the file downloaded as the given manifest entry only if it has been
+    modified since, empty if the entry has no validators."""
+    headers = {}
+    if entry.get("etag") is not None:
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified") is not None:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def _probe_ranges(url: str) -> Optional[dict]:
+    """Ask for the first byte of the file to tell whether the server supports ranges.
+    Returns the journal of a segmented download if so, otherwise None."""
+    headers = {"Accept-Encoding": "identity", "Range": "bytes=0-0"}
+    with _get(url, headers) as r:
+        r.raise_for_status()
+        content_range = r.headers.get("Content-Range", "")
+        if r.status_code != 206 or "/" not in content_range:
+            return None
+        total = content_range.rsplit("/", 1)[1]
+        if not total.isdigit():
+            return None
+        return {
+            "url": url,
+            "expected_length": int(total),
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "segment_size": int(get_config("download", "segment_size")),
+            "completed_segments": [],
+        }
+
+
+def _download_segments(
+    url: str,
+    file_path: str,
+    journal: dict,
+    cancel_event: threading.Event = None,
+    position: int = None,
+) -> None:
+    """Download the file in byte ranges of `segment_size` over `segment_connections` concurrent connections,
+    writing each range at its offset of the preallocated file. Completed segments are recorded in the journal,
+    so a retry only fetches the missing ones."""
+    length, segment_size = journal["expected_length"], journal["segment_size"]
+    n_segments = ceil(length / segment_size)
+    completed = set(journal["completed_segments"])
+    if not os.path.exists(file_path) or os.path.getsize(file_path) != length:
+        with open(file_path, "wb") as f:
+            f.truncate(length)
+        completed = set()
+    validator = journal.get("etag") or journal.get("last_modified")
+    journal_lock, abort_event, changed_event = (
+        threading.Lock(),
+        threading.Event(),
+        threading.Event(),
+    )
+
+    def fetch(pbar: tqdm, i: int) -> None:
+        start, end = i * segment_size, min((i + 1) * segment_size, length) - 1
+        headers = {"Accept-Encoding": "identity", "Range": f"bytes={start}-{end}"}
+        if validator is not None:
+            headers["If-Range"] = validator
+        with _get(url, headers) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                changed_event.set()
+                raise RuntimeError(f"{url} has changed on the server while downloading")
+            with open(file_path, "r+b") as f:
+                f.seek(start)
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if abort_event.is_set() or (
+                        cancel_event is not None and cancel_event.is_set()
+                    ):
+                        raise RuntimeError("cancelled since another download failed")
+                    f.write(chunk)
+                    pbar.update(len(chunk))
+                if f.tell() != end + 1:
+                    raise RuntimeError(
+                        f"the connection was closed at byte {f.tell()} of segment {start}-{end}"
+                    )
+        with journal_lock:
+            completed.add(i)
+            journal["completed_segments"] = sorted(completed)
+            _write_journal(file_path + JOURNAL_SUFFIX, journal)
+
+    _write_journal(file_path + JOURNAL_SUFFIX, journal)
+    pending = [i for i in range(n_segments) if i not in completed]
+    initial = sum(min(segment_size, length - i * segment_size) for i in completed)
+    connections = int(get_config("download", "segment_connections"))
+    with tqdm(
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        miniters=1,
+        disable=_quiet_progress_count > 0,
+        desc=f"Downloading {os.path.basename(file_path)} in {n_segments} segments",
+        initial=initial,
+        total=length,
+        position=position,
+    ) as pbar, ThreadPoolExecutor(max_workers=connections) as executor:
+        futures = [executor.submit(fetch, pbar, i) for i in pending]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        errors = [f.exception() for f in done if f.exception() is not None]
+        if len(errors) > 0:
+            shutdown_executor(executor, futures, abort_event)
+            if changed_event.is_set():
+                # segments of different versions cannot be joined, start over next time
+                _remove_partial_file(file_path)
+            raise errors[0]
+
+    if len(completed) != n_segments or os.path.getsize(file_path) != length:
+        raise RuntimeError(
+            f"only {len(completed)} of {n_segments} segments of {url} are downloaded"
+        )
+
+
+def _download_file(
+    url: str,
+    file_path: str,
+    cancel_event: threading.Event = None,
+    position: int = None,
+    conditional_headers: dict = None,
+) -> Optional[str]:
+    """Download the file of the given url, resuming the partial file left by an interrupted download if any.
+    Returns the SHA-256 digest of the file, computed while downloading, over the existing part when resuming,
+    and over the whole file after a segmented download whose segments arrive out of order.
+
+    With `conditional_headers` (If-None-Match and If-Modified-Since, see _get_conditional_headers()), the file is
+    downloaded from the start in one request, and only if the server answers 200. Returns None if it answers 304
+    Not Modified, and raises an error for any other status.
+
+    A journal next to the file records the url, the expected length, and the validators (ETag and Last-Modified) of
+    the file. If a partial file with a matching journal exists, the rest of it is requested with a Range header, and
+    an If-Range header so that the server sends the full file instead if it has changed. Servers not supporting
+    ranges send the full file as well, then it is downloaded from the start.
+
+    If `segment_connections` in the section `download` of config.ini is larger than 1 and the server supports
+    ranges, the file is downloaded in segments over concurrent connections instead, see _download_segments().
+    """
+    if conditional_headers:
+        # the partial file of a previous download cannot be joined with whatever the server sends
+        _remove_partial_file(file_path)
+    journal = _read_journal(file_path + JOURNAL_SUFFIX)
+    if (
+        journal is not None
+        and journal.get("url") == url
+        and "segment_size" in journal
+        and os.path.exists(file_path)
+    ):
+        _download_segments(url, file_path, journal, cancel_event, position)
+        return _hash_file(file_path).hexdigest()
+    offset, journal = _get_resume_offset(url, file_path)
+    if (
+        offset == 0
+        and not conditional_headers
+        and int(get_config("download", "segment_connections")) > 1
+    ):
+        segment_journal = _probe_ranges(url)
+        if (
+            segment_journal is not None
+            and segment_journal["expected_length"] > segment_journal["segment_size"]
+        ):
+            _download_segments(url, file_path, segment_journal, cancel_event, position)
+            return _hash_file(file_path).hexdigest()
+    if offset > 0 and offset == journal.get("expected_length"):
+        logger.info(f"{file_path} has been downloaded completely before.")
+        return _hash_file(file_path).hexdigest()
+
+    # ranges are offsets in the stored bytes, hence ask for the file as it is rather than an encoded one
+    headers = {"Accept-Encoding": "identity", **(conditional_headers or {})}
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = journal.get("etag") or journal["last_modified"]
+
+    with _get(url, headers) as r:
+        if conditional_headers and r.status_code == 304:
+            return None
+        if conditional_headers and r.status_code != 200:
+            r.raise_for_status()
+            raise RuntimeError(f"unexpected status {r.status_code} of {url}")
+        if r.status_code == 416:
+            # the partial file is not a prefix of the file on the server any more
+            _remove_partial_file(file_path)
+            return _download_file(url, file_path, cancel_event, position)
+        r.raise_for_status()
+        content_range = r.headers.get("Content-Range", "")
+        if r.status_code == 206 and not content_range.startswith(f"bytes {offset}-"):
+            # the body is a part of the file, but not the one following the partial file
+            if offset == 0:
+                raise RuntimeError(
+                    f"the server sent {content_range} of {url} without being asked for a range"
+                )
+            logger.warning(
+                f"‼️ The server sent {content_range} of {url} rather than from byte {offset}, "
+                f"downloading it from the start."
+            )
+            _remove_partial_file(file_path)
+            return _download_file(url, file_path, cancel_event, position)
+
+        content_length = r.headers.get("Content-Length")
+        content_length = int(content_length) if content_length is not None else None
+        hasher = hashlib.sha256()
+        if r.status_code == 206 and offset > 0:
+            logger.info(f"Resuming downloading {url} from byte {offset}")
+            _hash_file(file_path, hasher)
+        else:
+            offset = 0
+            journal = {
+                "url": url,
+                "expected_length": content_length,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+            _write_journal(file_path + JOURNAL_SUFFIX, journal)
+
+        with tqdm(
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            miniters=1,
+            disable=_quiet_progress_count > 0,
+            desc=f"Downloading {os.path.basename(file_path)}",
+            initial=offset,
+            total=journal["expected_length"],
+            position=position,
+        ) as pbar:
+            with open(file_path, "ab" if offset > 0 else "wb") as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RuntimeError("cancelled since another link failed")
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    pbar.update(len(chunk))
+
+    expected_length = journal["expected_length"]
+    if expected_length is not None and os.path.getsize(file_path) != expected_length:
+        raise RuntimeError(
+            f"the connection was closed at byte {os.path.getsize(file_path)} of {expected_length}"
+        )
+    return hasher.hexdigest()
+
+
+class _ProgressReader:
+    """A file-like reader of a streamed response body, updating the progress bar, hashing the body,
+    and checking for cancellation. The body is copied into `tee` as well if given."""
+
+    def __init__(
+        self,
+        response: requests.Response,
+        pbar: tqdm,
+        cancel_event: threading.Event = None,
+        tee=None,
+    ):
+        self.response = response
+        self.tee = tee
+        self.pbar = pbar
+        self.cancel_event = cancel_event
+        self.hasher = hashlib.sha256()
+        self.nbytes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise RuntimeError("cancelled since another link failed")
+        data = self.response.raw.read(None if size < 0 else size, decode_content=True)
+        self.hasher.update(data)
+        self.nbytes += len(data)
+        if self.tee is not None:
+            self.tee.write(data)
+        self.pbar.update(len(data))
+        return data
+
+
+def _decompress_gzip(fileobj, file_path: str) -> None:
+    # GzipFile.read(n) returns at most n decompressed bytes, so the memory is bounded by the copying buffer
+    # however large the file is or however well it is compressed
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as gz, open(file_path, "wb") as f:
+        shutil.copyfileobj(gz, f)
+
+
+def _stream_extract(
+    url: str,
+    extract_dir: str,
+    cancel_event: threading.Event = None,
+    position: int = None,
+    tee_path: str = None,
+    conditional_headers: dict = None,
+) -> Optional[Tuple[int, str, dict]]:
+    """Extract the tarball or decompress the gzipped file of the given url into the given dir while downloading it.
+    The archive is never read back from the disk, and only written to `tee_path` if given, e.g. to keep it in the
+    blob store, but an interrupted download cannot be resumed.
+    Returns the size, the SHA-256 digest, and the validators (ETag and Last-Modified) of the archive, or None if the
+    server answers 304 Not Modified to the `conditional_headers`, see _download_file().
+    """
+    file_name = os.path.basename(url)
+    with _get(url, {"Accept-Encoding": "identity", **(conditional_headers or {})}) as r:
+        if conditional_headers and r.status_code == 304:
+            return None
+        r.raise_for_status()
+        if conditional_headers and r.status_code != 200:
+            raise RuntimeError(f"unexpected status {r.status_code} of {url}")
+        content_length = r.headers.get("Content-Length")
+        with tqdm(
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            miniters=1,
+            disable=_quiet_progress_count > 0,
+            desc=f"Downloading and extracting {os.path.basename(url)}",
+            total=int(content_length) if content_length is not None else None,
+            position=position,
+        ) as pbar:
+            tee = open(tee_path, "wb") if tee_path is not None else None
+            try:
+                reader = _ProgressReader(r, pbar, cancel_event, tee)
+                if file_name.endswith(GZIP_SUFFIX):
+                    os.makedirs(extract_dir, exist_ok=True)
+                    _decompress_gzip(reader, os.path.join(extract_dir, file_name[:-3]))
+                else:
+                    # "r|*" reads the tarball sequentially, detecting gzip/bz2/xz compression from the stream
+                    with tarfile.open(fileobj=reader, mode="r|*") as tar:
+                        tar.extractall(extract_dir, **_TAR_EXTRACT_KWARGS)
+                # the padding after the end of the archive is hashed and copied as well
+                while len(reader.read(DOWNLOAD_CHUNK_SIZE)) > 0:
+                    pass
+            finally:
+                if tee is not None:
+                    tee.close()
+        validators = {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
+    return reader.nbytes, reader.hasher.hexdigest(), validators
+
+
+def _get_unpack_format(file_name: str) -> Optional[str]:
+    # told by the file name of the link, since files in the blob store are named by their digests
+    for name, extensions, _ in shutil.get_unpack_formats():
+        if file_name.endswith(tuple(extensions)):
+            return name
+    return None
+
+
+def _move_extracted(extract_dir: str, saving_path: str) -> list:
+    """Move the extracted files into the saving path, returning their names."""
+    # the extract dir and the saving path are on the same device, so these are renames rather than copies
+    names = os.listdir(extract_dir)
+    for name in names:
+        source, target = os.path.join(extract_dir, name), os.path.join(
+            saving_path, name
+        )
+        if os.path.isdir(source) and os.path.isdir(target):
+            # archives of the same dataset may share dirs, merge them as unpacking in place does
+            _move_extracted(source, target)
+            continue
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.replace(source, target)
+    os.rmdir(extract_dir)
+    return names
+
+
+def _download_and_extract(
+    url: str,
+    saving_path: str,
+    cancel_event: threading.Event = None,
+    position: int = None,
+    select_members: Callable[[list], Optional[list]] = None,
+    blob_store_dir: str = None,
+    previous: dict = None,
+) -> Optional[dict]:
     """Download dataset from the given url and extract to the given saving path.
+    A failed download leaves its partial file in the staging dir, and the next call resumes it.
+    The download is verified against the expected size and SHA-256 digest in tsdb.database.CHECKSUMS if any.
 
     Parameters
     ----------
@@ -28,10 +764,28 @@ def _download_and_extract(url: str, saving_path: str) -> Optional[str]:
         URL of the dataset to be downloaded.
     saving_path : str,
         Path to save extracted dataset.
+    cancel_event : threading.Event, optional
+        Set by other downloads of the same dataset if they failed, to abort this one early.
+    position : int, optional
+        The line of the progress bar, so that bars of concurrent downloads do not overwrite each other.
+    select_members : callable, optional
+        Given the member names of a zip archive, returns the names of the members to extract, or None to extract
+        all of them. The member names are read from the central directory at the end of the zip, and the other
+        members are never decompressed or written.
+    blob_store_dir : str, optional
+        The content-addressed store to keep the downloaded file in, see tsdb.utils.blob_store. A file already in
+        the store is linked or extracted from it without downloading. Plain files are hard linked into the saving
+        path, so they are stored once.
+    previous : dict, optional
+        The manifest entry of the file downloaded before, to refresh it. The blob store is skipped, and the file is
+        requested with the validators recorded in the entry, then only downloaded if the server answers 200.
+        If it answers 304 Not Modified, any other status, or the download fails, the file in the saving path is kept
+        and the entry is returned as it is.
 
     Returns
     -------
-    saving_path if successful else None
+    The manifest entry of the url, i.e. the size and SHA-256 digest of the downloaded file and the names of the
+    files it is extracted to in the saving path, if successful else None
     """
     no_need_decompression_format = ["csv", "txt"]
     supported_compression_format = ["zip", "tar", "gz", "bz", "xz"]
@@ -40,13 +794,10 @@ def _download_and_extract(url: str, saving_path: str) -> Optional[str]:
     file_name = os.path.basename(url)
     suffix = file_name.split(".")[-1]
 
-    if suffix in no_need_decompression_format:
-        raw_data_saving_path = os.path.join(saving_path, file_name)
-    elif suffix in supported_compression_format:
-        # create temp dir for raw data saving
-        tmp_dir = tempfile.mkdtemp()
-        raw_data_saving_path = os.path.join(tmp_dir, file_name)
-    else:
+    if (
+        suffix not in no_need_decompression_format
+        and suffix not in supported_compression_format
+    ):
         warnings.warn(
             "The compression format is not supported, aborting. "
             "If necessary, please create a pull request to add according supports.",
@@ -54,66 +805,182 @@ def _download_and_extract(url: str, saving_path: str) -> Optional[str]:
         )
         return None
 
+    staging_dir = _get_staging_dir(saving_path)
+    os.makedirs(staging_dir, exist_ok=True)
+    raw_data_saving_path = os.path.join(staging_dir, file_name)
+    # files in the blob store and local mirrors are linked or extracted in place,
+    # and HTTP mirrors are downloaded from instead
+    blob_path = (
+        find_blob(blob_store_dir, url)
+        if blob_store_dir is not None and previous is None
+        else None
+    )
+    source = _resolve_mirror(url) if blob_path is None else blob_path
+    if blob_path is not None:
+        logger.info(f"Found {file_name} in the blob store {blob_store_dir}")
+    elif source is not None:
+        logger.info(f"Found {file_name} in the mirror {source}")
+    local_path = source if source is not None and not _is_http(source) else None
+    download_url = source if source is not None and local_path is None else url
+    # archives are extracted in the staging dir first, then moved into the saving path with same-device renames
+    extract_dir = os.path.join(staging_dir, file_name + ".extracting")
+    shutil.rmtree(extract_dir, ignore_errors=True)
+    # tarballs and gzipped files are extracted while downloading unless a partial file of them is there to resume
+    streaming = (
+        local_path is None
+        and file_name.endswith(TAR_SUFFIXES + (GZIP_SUFFIX,))
+        and get_config("download", "stream_extraction").lower() == "true"
+        and not os.path.exists(raw_data_saving_path + JOURNAL_SUFFIX)
+    )
+    kept_note = "" if streaming else " The partial file is kept for resuming next time."
+    conditional_headers = None
+    if previous is not None and previous.get("source", url) == download_url:
+        conditional_headers = _get_conditional_headers(previous)
+
     # download and save the raw dataset
+    validators = {}
     try:
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            chunk_size = 8192
-            try:
-                size = int(r.headers["Content-Length"])
-            except KeyError:
-                size = None
-
-            with tqdm(
-                unit="B",
-                unit_scale=True,
-                unit_divisor=1024,
-                miniters=1,
-                desc=f"Downloading {file_name}",
-                total=size,
-            ) as pbar:
-                with open(raw_data_saving_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=chunk_size):
-                        f.write(chunk)
-                        pbar.update(len(chunk))
-
+        if blob_path is not None:
+            # blobs are named by their digests
+            sha256, size = os.path.basename(blob_path), os.path.getsize(blob_path)
+        elif local_path is not None:
+            sha256 = _hash_file(local_path).hexdigest()
+            size = os.path.getsize(local_path)
+        elif streaming:
+            streamed = _stream_extract(
+                download_url,
+                extract_dir,
+                cancel_event,
+                position,
+                raw_data_saving_path if blob_store_dir is not None else None,
+                conditional_headers,
+            )
+            if streamed is None:
+                logger.info(f"{file_name} is not modified on the server, keeping it.")
+                return previous
+            size, sha256, validators = streamed
+        else:
+            sha256 = _download_file(
+                download_url,
+                raw_data_saving_path,
+                cancel_event,
+                position,
+                conditional_headers,
+            )
+            if sha256 is None:
+                logger.info(f"{file_name} is not modified on the server, keeping it.")
+                return previous
+            size = os.path.getsize(raw_data_saving_path)
+            journal = _read_journal(raw_data_saving_path + JOURNAL_SUFFIX) or {}
+            validators = {key: journal.get(key) for key in ["etag", "last_modified"]}
     except Exception as e:
-        shutil.rmtree(saving_path, ignore_errors=True)
-        shutil.rmtree(raw_data_saving_path, ignore_errors=True)
-        raise RuntimeError(f"Exception: {e}\n" f"Download failed. Aborting.")
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        if streaming or previous is not None:
+            _remove_partial_file(raw_data_saving_path)
+        if previous is not None:
+            logger.warning(
+                f"‼️ Failed to refresh {file_name}, keeping the downloaded one: {e}"
+            )
+            return previous
+        raise RuntimeError(f"Exception: {e}\n" f"Download failed. Aborting.{kept_note}")
     except KeyboardInterrupt:
-        shutil.rmtree(saving_path, ignore_errors=True)
-        shutil.rmtree(raw_data_saving_path, ignore_errors=True)
-        raise KeyboardInterrupt("Download cancelled by the user.")
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        if streaming:
+            _remove_partial_file(raw_data_saving_path)
+        raise KeyboardInterrupt(f"Download cancelled by the user.{kept_note}")
 
-    logger.info(f"Successfully downloaded data to {raw_data_saving_path}")
+    try:
+        _verify_checksum(url, size, sha256)
+    except RuntimeError as e:
+        # a corrupted file should not be resumed
+        _remove_partial_file(raw_data_saving_path)
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        if previous is not None:
+            logger.warning(
+                f"‼️ Failed to refresh {file_name}, keeping the downloaded one: {e}"
+            )
+            return previous
+        raise
+    entry = {"file": file_name, "size": size, "sha256": sha256}
+    if local_path is None:
+        # validators of the downloaded file, for revalidating it with conditional requests when refreshing
+        entry.update(source=download_url, **validators)
+    elif blob_path is not None:
+        entry.update(get_blob_validators(blob_store_dir, url))
+    if blob_store_dir is not None and local_path is None:
+        local_path = put_blob(
+            blob_store_dir,
+            url,
+            raw_data_saving_path,
+            sha256,
+            {key: entry[key] for key in ["source", "etag", "last_modified"]},
+        )
+        _remove_partial_file(raw_data_saving_path)
+
+    os.makedirs(saving_path, exist_ok=True)
+    if streaming:
+        entry["outputs"] = _move_extracted(extract_dir, saving_path)
+        logger.info(f"Successfully downloaded and extracted data to {saving_path}")
+        return entry
 
-    # if the file is compressed, then unpack it
-    if suffix in supported_compression_format:
+    if source is None:
+        logger.info(
+            f"Successfully downloaded data to {raw_data_saving_path if local_path is None else local_path}"
+        )
+    raw_file_path = raw_data_saving_path if local_path is None else local_path
+    if suffix in no_need_decompression_format:
+        if local_path is None:
+            os.replace(raw_data_saving_path, os.path.join(saving_path, file_name))
+            _remove_partial_file(raw_data_saving_path)
+        else:
+            _link_or_copy(local_path, os.path.join(saving_path, file_name))
+        entry["outputs"] = [file_name]
+    else:
+        # if the file is compressed, then unpack it
         try:
-            os.makedirs(saving_path, exist_ok=True)
-            if ".txt.gz" in file_name:
-                new_name = file_name.split(".txt.gz")[0]
-                new_name = new_name + ".txt"
-                saving_path = os.path.join(saving_path, new_name)
-                with open(raw_data_saving_path, "rb") as f, open(
-                    saving_path, "wb"
-                ) as wf:
-                    wf.write(gzip.decompress(f.read()))
+            if file_name.endswith(GZIP_SUFFIX):
+                entry["outputs"] = [file_name[:-3]]
+                with open(raw_file_path, "rb") as f:
+                    _decompress_gzip(f, os.path.join(saving_path, file_name[:-3]))
             else:
-                shutil.unpack_archive(raw_data_saving_path, saving_path)
+                members = None
+                if select_members is not None and zipfile.is_zipfile(raw_file_path):
+                    with zipfile.ZipFile(raw_file_path) as zip_file:
+                        members = select_members(zip_file.namelist())
+                        if members is not None:
+                            zip_file.extractall(extract_dir, members=members)
+                            entry["selected"] = True
+                if members is None:
+                    shutil.unpack_archive(
+                        raw_file_path, extract_dir, _get_unpack_format(file_name)
+                    )
+                entry["outputs"] = _move_extracted(extract_dir, saving_path)
             logger.info(f"Successfully extracted data to {saving_path}")
         except Exception as e:
-            shutil.rmtree(saving_path, ignore_errors=True)
+            shutil.rmtree(extract_dir, ignore_errors=True)
             raise RuntimeError(f"❌ {e}")
         finally:
-            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # a corrupted archive should not be resumed either
+            _remove_partial_file(raw_data_saving_path)
+
+    return entry
 
-    return saving_path
 
+def download_and_extract(
+    dataset_name: str,
+    dataset_saving_path: str,
+    select_members: Callable[[list], Optional[list]] = None,
+    use_blob_store: bool = False,
+    refresh: bool = False,
+    cancel_event: threading.Event = None,
+) -> None:
+    """Wrapper of _download_and_extract. Links of the dataset are downloaded concurrently by a thread pool
+    of `max_workers` (in the section `download` of config.ini) threads. It is all or nothing: if any link fails,
+    the others are aborted and `dataset_saving_path` is deleted, unless it holds files verified before.
 
-def download_and_extract(dataset_name: str, dataset_saving_path: str) -> None:
-    """Wrapper of _download_and_extract.
+    The size, SHA-256 digest, and extracted files of each link are recorded in the manifest in
+    `dataset_saving_path`. Links verified by the manifest are skipped, so that calling it on a partly broken
+    dataset dir only re-fetches the missing or mismatching files, keeping the verified ones even if it fails.
 
     Parameters
     ----------
@@ -123,11 +990,122 @@ def download_and_extract(dataset_name: str, dataset_saving_path: str) -> None:
     dataset_saving_path : str,
         The local path for dataset saving.
 
+    select_members : callable, optional
+        Selecting the members to extract from zip archives of the dataset, see _download_and_extract().
+        tsdb.load() passes one extracting only the files read by the loading function, e.g. for UCR/UEA datasets.
+        If not given, all members are extracted, and links extracted selectively before are fetched again.
+
+    use_blob_store : bool,
+        Whether to keep the downloaded files in the content-addressed store next to `dataset_saving_path`, see
+        tsdb.utils.blob_store, from which the dataset dir can be re-created without network. tsdb.load() uses the
+        store under tsdb_home if `blob_store` in the section `download` of config.ini is true.
+
+    refresh : bool,
+        Whether to revalidate the files verified by the manifest with conditional requests (If-None-Match and
+        If-Modified-Since with the ETag and Last-Modified recorded when they were downloaded). The body of a file
+        answered with 200 replaces it, and files answered with 304 Not Modified, any other status, or failing to be
+        downloaded are kept. tsdb.load(use_cache=False) refreshes.
+
+    cancel_event : threading.Event, optional
+        Set by the caller to abort the downloads early, e.g. by tsdb.prefetch() when interrupted.
+
     """
-    logger.info("Start downloading...")
-    os.makedirs(dataset_saving_path)
-    if isinstance(DATABASE[dataset_name], list):
-        for link in DATABASE[dataset_name]:
-            _download_and_extract(link, dataset_saving_path)
-    else:
-        _download_and_extract(DATABASE[dataset_name], dataset_saving_path)
+    # processes downloading into the same path take turns instead of racing, reentrant if tsdb.load() holds it
+    with FileLock(get_lock_path(dataset_saving_path)):
+        links = DATABASE[dataset_name]
+        links = links if isinstance(links, list) else [links]
+        manifest = read_manifest(dataset_saving_path)
+        pending_links = [
+            link
+            for link in links
+            if not _is_verified(link, manifest.get(link), dataset_saving_path)
+            or (select_members is None and manifest[link].get("selected", False))
+        ]
+        verified_links = [link for link in links if link not in pending_links]
+        if len(pending_links) == 0 and not refresh:
+            logger.info(f"All files of dataset {dataset_name} have been verified.")
+            return
+        if refresh and len(verified_links) > 0:
+            logger.info(
+                f"Revalidating {len(verified_links)} verified files of dataset {dataset_name} with the servers..."
+            )
+        elif len(verified_links) > 0:
+            logger.info(
+                f"{len(verified_links)} of {len(links)} files of dataset {dataset_name} have been "
+                f"verified, re-fetching the others..."
+            )
+
+        logger.info("Start downloading...")
+        os.makedirs(dataset_saving_path, exist_ok=True)
+        try:
+            entries = _download_links(
+                links if refresh else pending_links,
+                dataset_saving_path,
+                select_members,
+                get_blob_store_dir(dataset_saving_path) if use_blob_store else None,
+                {link: manifest[link] for link in verified_links} if refresh else None,
+                cancel_event,
+            )
+        except BaseException:
+            # verified files are never deleted, whatever happens to the others
+            if len(verified_links) == 0:
+                shutil.rmtree(dataset_saving_path, ignore_errors=True)
+            raise
+        manifest.update({link: e for link, e in entries.items() if e is not None})
+        _write_journal(os.path.join(dataset_saving_path, MANIFEST_NAME), manifest)
+        _remove_staging_dir(dataset_saving_path)
+
+
+def _download_links(
+    links: list,
+    dataset_saving_path: str,
+    select_members: Callable[[list], Optional[list]] = None,
+    blob_store_dir: str = None,
+    previous_entries: dict = None,
+    cancel_event: threading.Event = None,
+) -> dict:
+    """Download and extract the given links into the dataset dir, returning their manifest entries.
+    Links in `previous_entries` are refreshed, see the argument `previous` of _download_and_extract().
+    The downloads are aborted once `cancel_event` is set.
+    """
+    previous_entries = {} if previous_entries is None else previous_entries
+    if len(links) == 1:
+        return {
+            links[0]: _download_and_extract(
+                links[0],
+                dataset_saving_path,
+                cancel_event,
+                select_members=select_members,
+                blob_store_dir=blob_store_dir,
+                previous=previous_entries.get(links[0]),
+            )
+        }
+
+    # set by a failed link to abort the others, without aborting the downloads of other datasets sharing the parent
+    cancel_event = LinkedEvent(cancel_event)
+    max_workers = min(int(get_config("download", "max_workers")), len(links))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                _download_and_extract,
+                link,
+                dataset_saving_path,
+                cancel_event,
+                i,
+                select_members,
+                blob_store_dir,
+                previous_entries.get(link),
+            )
+            for i, link in enumerate(links)
+        ]
+        try:
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        except KeyboardInterrupt:
+            shutdown_executor(executor, futures, cancel_event)
+            raise KeyboardInterrupt("Download cancelled by the user.")
+        errors = [f.exception() for f in done if f.exception() is not None]
+        if len(errors) > 0:
+            # abort the running downloads and skip the pending ones, then clean up after all of them stopped
+            shutdown_executor(executor, futures, cancel_event)
+            raise errors[0]
+    return {link: f.result() for link, f in zip(links, futures)}
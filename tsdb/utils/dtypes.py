@@ -0,0 +1,175 @@
+"""
+Dtype policies deciding the numeric dtypes of loaded datasets.
+"""
+
+# Created by Wenjie Du <wenjay.du@gmail.com>
+# License: BSD-3-Clause
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# "default" keeps the dtypes parsed by pandas, e.g. float64,
+# "compact" downcasts floats to float32 and integers to the smallest nullable integer dtype holding them,
+# and encodes repeated strings as categoricals or integer codes
+DTYPE_POLICIES = ["default", "compact"]
+# string columns with fewer unique values than this fraction of their length are encoded as categoricals
+CATEGORICAL_MAX_UNIQUE_RATIO = 0.5
+
+
+def get_float_dtype(dtype_policy: str) -> Optional[type]:
+    """Get the dtype to parse float columns into under the given policy, None means leaving it to pandas.
+    Loading functions pass it to pandas.read_csv(), so that float64 copies of large tables are never created.
+    """
+    assert (
+        dtype_policy in DTYPE_POLICIES
+    ), f"dtype_policy should be one of {DTYPE_POLICIES}, but got {dtype_policy}"
+    return np.float32 if dtype_policy == "compact" else None
+
+
+def _get_nullable_int_dtype(dtype: np.dtype) -> str:
+    return f"{'U' if dtype.kind == 'u' else ''}Int{dtype.itemsize * 8}"
+
+
+def downcast_frame(df: pd.DataFrame, dtype_policy: str) -> pd.DataFrame:
+    """Downcast the numeric columns of the given DataFrame under the given policy.
+
+    Parameters
+    ----------
+    df :
+        The DataFrame to downcast.
+
+    dtype_policy :
+        The dtype policy, should be one of DTYPE_POLICIES.
+
+    Returns
+    -------
+    df :
+        The downcast DataFrame, or the given one if the policy is "default".
+
+    """
+    assert (
+        dtype_policy in DTYPE_POLICIES
+    ), f"dtype_policy should be one of {DTYPE_POLICIES}, but got {dtype_policy}"
+    if dtype_policy == "default":
+        return df
+
+    new_dtypes, float_columns = {}, {}
+    for column, dtype in df.dtypes.items():
+        if isinstance(dtype, (pd.Float32Dtype, pd.Float64Dtype)):
+            # concatenating nullable integer and float columns gives nullable floats, use NaN for missing values
+            float_columns[column] = df[column].to_numpy(np.float32, na_value=np.nan)
+            continue
+        if not isinstance(dtype, np.dtype):
+            continue
+        if dtype.kind == "f" and dtype.itemsize > 4:
+            new_dtypes[column] = np.float32
+        elif dtype.kind in "iu":
+            downcast = pd.to_numeric(
+                df[column], downcast="integer" if dtype.kind == "i" else "unsigned"
+            )
+            new_dtypes[column] = _get_nullable_int_dtype(downcast.dtype)
+    if len(float_columns) > 0:
+        df = df.copy(deep=False)
+        for column, values in float_columns.items():
+            df[column] = values
+    if len(new_dtypes) == 0:
+        return df
+    return df.astype(new_dtypes)
+
+
+def encode_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """Encode string columns with repeated values as pandas categoricals, e.g. RecordID of physionet_2019 and
+    station of beijing_multisite_air_quality. Each value is then stored once plus an integer code per row,
+    and grouping by the column works on the codes.
+
+    Parameters
+    ----------
+    df :
+        The DataFrame to encode.
+
+    Returns
+    -------
+    df :
+        The encoded DataFrame.
+
+    """
+    categorical_columns = []
+    for column, dtype in df.dtypes.items():
+        if not (
+            pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+        ):
+            continue
+        values = df[column]
+        if values.nunique() > CATEGORICAL_MAX_UNIQUE_RATIO * len(values):
+            continue
+        # object columns may mix strings with other objects, which are left as they are
+        if pd.api.types.infer_dtype(values, skipna=True) == "string":
+            categorical_columns.append(column)
+    if len(categorical_columns) == 0:
+        return df
+    return df.astype({column: "category" for column in categorical_columns})
+
+
+def encode_labels(*labels: np.ndarray) -> tuple:
+    """Encode the given label arrays as integer codes into one shared lookup table of classes.
+
+    Parameters
+    ----------
+    labels :
+        Label arrays, e.g. y_train and y_test of a UCR/UEA dataset.
+
+    Returns
+    -------
+    codes :
+        A list of the integer code arrays, in the smallest signed integer dtype holding the codes.
+
+    classes :
+        The sorted lookup table, `classes[codes]` gives back the labels.
+
+    """
+    classes, codes = np.unique(np.concatenate(labels), return_inverse=True)
+    codes = codes.astype(np.min_scalar_type(-len(classes)))
+    boundaries = np.cumsum([len(y) for y in labels])[:-1]
+    return np.split(codes, boundaries), classes
+
+
+def apply_dtype_policy(result: dict, dtype_policy: str) -> dict:
+    """Downcast DataFrame, Series, and float ndarray values of the loaded dataset under the given policy,
+    and encode repeated strings in DataFrame values as categoricals.
+    Values already downcast by the loading function are kept as they are.
+
+    Parameters
+    ----------
+    result :
+        The loaded dataset.
+
+    dtype_policy :
+        The dtype policy, should be one of DTYPE_POLICIES.
+
+    Returns
+    -------
+    result :
+        The dataset with downcast values.
+
+    """
+    if dtype_policy == "default":
+        return result
+
+    for key, value in result.items():
+        if isinstance(value, pd.DataFrame):
+            # strings are encoded here rather than in downcast_frame(), since loading functions downcast frames
+            # of single entities before concatenating them, and concatenating categoricals of different
+            # categories gives back object columns
+            result[key] = encode_strings(downcast_frame(value, dtype_policy))
+        elif isinstance(value, pd.Series):
+            result[key] = downcast_frame(value.to_frame(), dtype_policy).iloc[:, 0]
+            result[key] = result[key].rename(value.name)
+        elif (
+            isinstance(value, np.ndarray)
+            and value.dtype.kind == "f"
+            and value.dtype.itemsize > 4
+        ):
+            result[key] = value.astype(np.float32)
+    return result
@@ -0,0 +1,60 @@
+"""
+Helpers of thread pools running downloads and datasets concurrently.
+"""
+
+# Created by Wenjie Du <wenjay.du@gmail.com>
+# License: BSD-3-Clause
+
+import threading
+from concurrent.futures import Executor
+
+
+def shutdown_executor(
+    executor: Executor,
+    futures,
+    cancel_event: threading.Event = None,
+    wait: bool = True,
+) -> None:
+    """Cancel the pending futures and shut the executor down, e.g. when one of the futures failed.
+    executor.shutdown(cancel_futures=True) needs Python 3.9, so the pending futures are cancelled one by one.
+
+    Parameters
+    ----------
+    executor :
+        The executor running the futures.
+
+    futures :
+        The futures submitted to the executor.
+
+    cancel_event :
+        The event checked by the running futures, which is set to make them stop early.
+
+    wait :
+        Whether to wait for the running futures to stop.
+
+    """
+    if cancel_event is not None:
+        cancel_event.set()
+    for future in futures:
+        future.cancel()
+    executor.shutdown(wait=wait)
+
+
+class LinkedEvent(threading.Event):
+    """An event that is also set once its parent is set. Setting the parent, e.g. when tsdb.prefetch() is interrupted,
+    sets all the events linked to it, while setting one of them, e.g. when a link of a dataset failed, only sets itself.
+    Only `is_set()` follows the parent, `wait()` does not.
+
+    Parameters
+    ----------
+    parent :
+        The parent event, a plain event if not given.
+
+    """
+
+    def __init__(self, parent: threading.Event = None):
+        super().__init__()
+        self.parent = parent
+
+    def is_set(self) -> bool:
+        return super().is_set() or (self.parent is not None and self.parent.is_set())
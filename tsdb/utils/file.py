@@ -148,6 +148,72 @@ def pickle_load(path: str) -> object:
     return data
 
 
+def get_size(path: str) -> int:
+    """Get the size of the given file, or the total size of all files in the given directory.
+
+    Parameters
+    ----------
+    path :
+        It could be a file or a fold.
+
+    Returns
+    -------
+    size :
+        The size in bytes, 0 if the path does not exist.
+
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    size, counted_inodes = 0, set()
+    for root, _, files in os.walk(path):
+        for f in files:
+            file_path = os.path.join(root, f)
+            if os.path.islink(file_path):
+                continue
+            stat = os.stat(file_path)
+            # hard links of the same file, e.g. blobs linked into dataset dirs, take the space once
+            if stat.st_nlink > 1:
+                if (stat.st_dev, stat.st_ino) in counted_inodes:
+                    continue
+                counted_inodes.add((stat.st_dev, stat.st_ino))
+            size += stat.st_size
+    return size
+
+
+def get_freeable_size(path: str) -> int:
+    """Get the bytes freed by deleting the given file or directory. Files also hard linked from outside of it,
+    e.g. blobs linked into dataset dirs, keep taking their space, so they are not counted.
+
+    Parameters
+    ----------
+    path :
+        It could be a file or a fold.
+
+    Returns
+    -------
+    size :
+        The freeable size in bytes, 0 if the path does not exist.
+
+    """
+    file_paths = [path] if os.path.isfile(path) else []
+    for root, _, files in os.walk(path):
+        file_paths.extend(os.path.join(root, f) for f in files)
+
+    # the number of links of each file inside the path, and the size of the file
+    inodes = {}
+    for file_path in file_paths:
+        if os.path.islink(file_path):
+            continue
+        stat = os.stat(file_path)
+        key = (stat.st_dev, stat.st_ino)
+        n_links, _, _ = inodes.get(key, (0, stat.st_nlink, stat.st_size))
+        inodes[key] = (n_links + 1, stat.st_nlink, stat.st_size)
+    return sum(
+        size for n_links, st_nlink, size in inodes.values() if n_links >= st_nlink
+    )
+
+
 def purge_path(path: str, ignore_errors: bool = True) -> None:
     """Delete the given path.
     It will be deleted if a file is given. Itself and all its contents will be purged will a fold is given.
@@ -258,13 +324,25 @@ def migrate(
     else:
         logger.warning(f"‼️ Note that new_path {new_path} already exists.")
 
+    # hard links among the copied files, e.g. blobs linked into dataset dirs, are kept linked in the new path
+    copied_inodes = {}
+
+    def copy_file(src: str, dst: str) -> str:
+        stat = os.stat(src)
+        if stat.st_nlink > 1:
+            if (stat.st_dev, stat.st_ino) in copied_inodes:
+                os.link(copied_inodes[(stat.st_dev, stat.st_ino)], dst)
+                return dst
+            copied_inodes[(stat.st_dev, stat.st_ino)] = dst
+        return shutil.copy2(src, dst)
+
     all_old_files = os.listdir(old_path)
     for f in all_old_files:
         old_f_path = os.path.join(old_path, f)
 
         if os.path.isdir(old_f_path):
             new_f_path = os.path.join(new_path, f)
-            shutil.copytree(old_f_path, new_f_path)
+            shutil.copytree(old_f_path, new_f_path, copy_function=copy_file)
         else:
             shutil.move(old_f_path, new_path)
 
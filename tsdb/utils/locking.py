@@ -0,0 +1,147 @@
+"""
+File locks coordinating concurrent processes working on the same dataset.
+"""
+
+# Created by Wenjie Du <wenjay.du@gmail.com>
+# License: BSD-3-Clause
+
+import hashlib
+import os
+import threading
+import time
+
+from .file import determine_tsdb_home
+from .logging import logger
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# the hidden dir holding lock files
+LOCK_DIR_NAME = ".locks"
+
+# locks held by the current thread, making FileLock reentrant, e.g. tsdb.load() calls download_and_extract()
+_held_locks = threading.local()
+_lock_dir = None
+
+
+def get_lock_path(path: str) -> str:
+    """Get the lock file path guarding the given path.
+    Lock files are kept in the hidden dir `.locks` under tsdb_home, named by the guarded path and a short hash of it,
+    so purging the path keeps the lock valid, and no lock files are left next to paths out of tsdb_home,
+    e.g. the dir given to download_and_extract().
+
+    Parameters
+    ----------
+    path :
+        The path to be guarded, e.g. a dataset dir.
+
+    Returns
+    -------
+    lock_path :
+        The path of the lock file.
+
+    """
+    global _lock_dir
+    if _lock_dir is None:
+        _lock_dir = os.path.join(determine_tsdb_home(), LOCK_DIR_NAME)
+    path = os.path.abspath(path)
+    path_hash = hashlib.sha1(path.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(_lock_dir, f"{os.path.basename(path)}-{path_hash}.lock")
+
+
+class FileLock:
+    """An exclusive or shared inter-process lock on a file, used as a context manager.
+    The lock is released by the OS if the holding process dies, so there are no stale locks to clean.
+    It is reentrant within a thread, and different threads of a process exclude each other as well.
+
+    Parameters
+    ----------
+    lock_path :
+        The path of the lock file, created if it does not exist.
+
+    poll_interval :
+        Seconds between attempts to take the lock while another process holds it (only used on Windows).
+
+    shared :
+        Whether to take a shared lock, e.g. for reading a cache, which many holders can take at the same time while
+        the exclusive lock waits for all of them. Windows has no shared locks, where it is exclusive as well.
+        A thread holding a shared lock cannot take the exclusive lock on the same file.
+
+    """
+
+    def __init__(
+        self, lock_path: str, poll_interval: float = 0.5, shared: bool = False
+    ):
+        self.lock_path = os.path.abspath(lock_path)
+        self.poll_interval = poll_interval
+        self.shared = shared
+        self._fd = None
+
+    def _try_lock(self) -> bool:
+        try:
+            if os.name == "nt":
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+            else:
+                mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+                fcntl.flock(self._fd, mode | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Take the lock, waiting for other holders if `blocking`. Returns whether the lock is taken."""
+        held = _held_locks.__dict__.setdefault("counts", {})
+        held_shared = _held_locks.__dict__.setdefault("shared", set())
+        if held.get(self.lock_path, 0) > 0:
+            assert (
+                self.shared or self.lock_path not in held_shared
+            ), f"The shared lock {self.lock_path} held by the current thread cannot be upgraded to an exclusive one"
+            held[self.lock_path] += 1
+            return True
+
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT)
+        if not self._try_lock():
+            if not blocking:
+                os.close(self._fd)
+                self._fd = None
+                return False
+            logger.info(
+                f"Waiting for another process working on the same data to finish, lock file {self.lock_path}"
+            )
+            if os.name == "nt":
+                while not self._try_lock():
+                    time.sleep(self.poll_interval)
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        held[self.lock_path] = 1
+        if self.shared:
+            held_shared.add(self.lock_path)
+        return True
+
+    def release(self) -> None:
+        held = _held_locks.__dict__.setdefault("counts", {})
+        held[self.lock_path] -= 1
+        if held[self.lock_path] > 0:
+            return
+
+        del held[self.lock_path]
+        _held_locks.__dict__.setdefault("shared", set()).discard(self.lock_path)
+        if self._fd is not None:
+            try:
+                if os.name == "nt":
+                    msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -0,0 +1,195 @@
+"""
+In-process memory cache of loaded datasets.
+"""
+
+# Created by Wenjie Du <wenjay.du@gmail.com>
+# License: BSD-3-Clause
+
+import copy
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+from .config import get_config
+from .logging import logger
+
+
+def estimate_nbytes(value) -> int:
+    """Estimate the memory size of the given value in bytes.
+
+    Parameters
+    ----------
+    value :
+        A loaded dataset or any value in it.
+
+    Returns
+    -------
+    nbytes :
+        The estimated size in bytes.
+
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        nbytes = value.memory_usage(deep=True)
+        return int(nbytes.sum()) if isinstance(value, pd.DataFrame) else int(nbytes)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, Mapping):
+        return sum(estimate_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class MemoryCache:
+    """A thread-safe LRU cache of loaded datasets bounded by a byte budget.
+
+    Parameters
+    ----------
+    max_bytes :
+        The byte budget of the cache. The least recently used datasets are evicted when it is exceeded.
+        The cache is disabled if it is 0.
+
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, return_copy: bool = True) -> Optional[object]:
+        """Get the cached dataset of the given key, or None if not cached.
+
+        Parameters
+        ----------
+        key :
+            The key of the dataset, e.g. its name plus the load options.
+
+        return_copy :
+            Whether to return a deep copy of the cached dataset rather than the shared object.
+            The shared object is faster to get, but modifying it will affect later hits.
+
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            value = self._entries[key][0]
+        return copy.deepcopy(value) if return_copy else value
+
+    def put(self, key: Hashable, value: object) -> bool:
+        """Cache the given dataset with the key, evicting the least recently used ones if over the budget.
+
+        Parameters
+        ----------
+        key :
+            The key of the dataset, e.g. its name plus the load options.
+
+        value :
+            The loaded dataset.
+
+        Returns
+        -------
+        cached :
+            Whether the dataset is cached.
+
+        """
+        if self.max_bytes <= 0:
+            return False
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            logger.info(
+                f"Dataset of {nbytes} bytes exceeds the memory cache budget {self.max_bytes} bytes, not cached."
+            )
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._current_bytes -= self._entries.pop(key)[1]
+            while self._current_bytes + nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._current_bytes -= evicted_nbytes
+            self._entries[key] = (value, nbytes)
+            self._current_bytes += nbytes
+        return True
+
+    def invalidate(self, match) -> None:
+        """Drop the cached datasets whose keys satisfy the given predicate."""
+        with self._lock:
+            for key in [k for k in self._entries.keys() if match(k)]:
+                self._current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self) -> None:
+        """Drop all cached datasets and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Set the byte budget, evicting the least recently used datasets if the new one is exceeded."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self._current_bytes > max(max_bytes, 0):
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._current_bytes -= evicted_nbytes
+
+    def info(self) -> dict:
+        """Statistics of the cache, entries are ordered from the least to the most recently used."""
+        with self._lock:
+            return {
+                "max_bytes": self.max_bytes,
+                "current_bytes": self._current_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": [
+                    {"key": key, "nbytes": nbytes}
+                    for key, (_, nbytes) in self._entries.items()
+                ],
+            }
+
+
+# the memory cache shared by all tsdb.load() calls in the current process
+MEMORY_CACHE = MemoryCache(int(get_config("cache", "memory_cache_max_bytes")))
+
+
+def memory_cache_info() -> dict:
+    """Get statistics of the in-process memory cache of tsdb.load().
+
+    Returns
+    -------
+    info : dict
+        A dict contains the byte budget `max_bytes`, the used bytes `current_bytes`, the numbers of `hits` and
+        `misses`, and the cached `entries` ordered from the least to the most recently used.
+
+    """
+    return MEMORY_CACHE.info()
+
+
+def clear_memory_cache() -> None:
+    """Drop all datasets held in the in-process memory cache of tsdb.load()."""
+    MEMORY_CACHE.clear()
+    logger.info("Cleared the in-process memory cache.")
+
+
+def set_memory_cache_max_bytes(max_bytes: int) -> None:
+    """Set the byte budget of the in-process memory cache of tsdb.load() for the current process.
+    The default budget is `memory_cache_max_bytes` in the section `cache` of config.ini.
+
+    Parameters
+    ----------
+    max_bytes :
+        The byte budget. Setting it as 0 disables the memory cache.
+
+    """
+    MEMORY_CACHE.set_max_bytes(max_bytes)
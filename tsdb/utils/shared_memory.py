@@ -0,0 +1,315 @@
+"""
+Publishing loaded datasets into shared memory, letting processes on the same node attach to them without copies.
+"""
+
+# Created by Wenjie Du <wenjay.du@gmail.com>
+# License: BSD-3-Clause
+
+import hashlib
+import os
+import pickle
+import struct
+import sys
+import tempfile
+from collections.abc import Mapping
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from .locking import LOCK_DIR_NAME, FileLock
+from .logging import logger
+
+# the meta block starts with the reference count and the length of the pickled layout
+_HEADER = struct.Struct("qq")
+# offsets of arrays in data blocks are aligned to cache lines
+_ALIGNMENT = 64
+# numpy dtype kinds that can be shared as raw bytes: bool, (unsigned) int, float, complex, datetime, and timedelta
+_SHAREABLE_KINDS = "biufcmM"
+# SharedMemory can be kept out of the resource tracker since Python 3.13
+_TRACK_ARG = sys.version_info >= (3, 13)
+
+
+def _is_shareable(array) -> bool:
+    return isinstance(array, np.ndarray) and array.dtype.kind in _SHAREABLE_KINDS
+
+
+def _block_name(name: str, i: int = None) -> str:
+    # names of shared memory blocks are limited to 31 characters on macOS, so the dataset name is hashed
+    block_name = f"tsdb_{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+    return block_name if i is None else f"{block_name}_{i}"
+
+
+def _open_block(name: str, create: bool = False, size: int = 0) -> SharedMemory:
+    if _TRACK_ARG:
+        return SharedMemory(name, create=create, size=size, track=False)
+    block = SharedMemory(name, create=create, size=size)
+    if os.name != "nt":
+        # the resource tracker would unlink the block when this process exits even if others still use it,
+        # while its lifetime is managed by the reference count in the meta block
+        resource_tracker.unregister(block._name, "shared_memory")
+    return block
+
+
+def _unlink_block(block: SharedMemory) -> None:
+    if not _TRACK_ARG and os.name != "nt":
+        # SharedMemory.unlink() unregisters the block from the resource tracker, so register it back first
+        resource_tracker.register(block._name, "shared_memory")
+    block.unlink()
+
+
+def _close_block(block: SharedMemory) -> None:
+    try:
+        block.close()
+    except BufferError:
+        # views of the block are still referenced by the caller, it is unmapped when they are garbage collected
+        pass
+
+
+def _get_lock(name: str) -> FileLock:
+    # shared memory is local to the node, so is its lock, rather than in tsdb_home that may be on a shared disk
+    return FileLock(
+        os.path.join(tempfile.gettempdir(), LOCK_DIR_NAME, f"tsdb_shm_{name}.lock")
+    )
+
+
+class SharedDataset(Mapping):
+    """A read-only dict-like dataset whose numeric arrays live in shared memory blocks.
+    Get it with tsdb.publish() in the process loading the dataset and with tsdb.attach() in the others.
+
+    ndarray values, and numeric columns of DataFrame and Series values are zero-copy read-only views of the blocks.
+    The other values, e.g. string columns and indices, are unpickled into each attaching process.
+    The blocks are unlinked when the last process holding the dataset calls detach().
+
+    Parameters
+    ----------
+    name :
+        The name of the published dataset.
+
+    layout :
+        The layout of the dataset, telling where each array is in the data blocks.
+
+    meta_block :
+        The shared memory block holding the reference count and the pickled layout.
+
+    data_blocks :
+        The shared memory blocks holding arrays of the dataset, keyed by the dataset keys.
+
+    """
+
+    def __init__(
+        self, name: str, layout: dict, meta_block: SharedMemory, data_blocks: dict
+    ):
+        self.name = name
+        self._meta_block = meta_block
+        self._data_blocks = data_blocks
+        self._values = {
+            key: self._build_value(key, entry) for key, entry in layout.items()
+        }
+        self._detached = False
+
+    def _view(self, key, spec: tuple) -> np.ndarray:
+        offset, dtype, shape = spec
+        array = np.ndarray(
+            shape,
+            dtype=np.dtype(dtype),
+            buffer=self._data_blocks[key].buf,
+            offset=offset,
+        )
+        array.flags.writeable = False
+        return array
+
+    def _build_value(self, key, entry: dict):
+        if entry["type"] == "ndarray":
+            return self._view(key, entry["array"])
+        if entry["type"] == "object":
+            return entry["value"]
+
+        arrays = [
+            self._view(key, spec) if shared else spec
+            for shared, spec in entry["columns"]
+        ]
+        if entry["type"] == "Series":
+            return pd.Series(
+                arrays[0], index=entry["index"], name=entry["name"], copy=False
+            )
+        frame = pd.DataFrame(dict(enumerate(arrays)), index=entry["index"], copy=False)
+        frame.columns = entry["column_names"]
+        return frame
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __repr__(self) -> str:
+        return f"SharedDataset(name={self.name!r}, keys={list(self._values)})"
+
+    def detach(self) -> None:
+        """Release the dataset in the current process, and unlink its blocks if no other process holds it.
+        Views got from the dataset must not be used afterwards.
+        """
+        if self._detached:
+            return
+        self._detached = True
+        self._values = {}
+        blocks = [self._meta_block, *self._data_blocks.values()]
+        with _get_lock(self.name):
+            ref_count, layout_nbytes = _HEADER.unpack_from(self._meta_block.buf, 0)
+            _HEADER.pack_into(self._meta_block.buf, 0, ref_count - 1, layout_nbytes)
+            if ref_count <= 1:
+                for block in blocks:
+                    _unlink_block(block)
+                logger.info(
+                    f"Unlinked the shared memory of dataset {self.name}, no process holds it."
+                )
+        for block in blocks:
+            _close_block(block)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.detach()
+
+
+def _pack_arrays(arrays: list) -> tuple:
+    """Lay out the given arrays in one block, returning their specs (offset, dtype, shape) and the block size."""
+    specs, size = [], 0
+    for array in arrays:
+        size = -(-size // _ALIGNMENT) * _ALIGNMENT
+        specs.append((size, array.dtype.str, array.shape))
+        size += array.nbytes
+    return specs, size
+
+
+def publish_dataset(result: dict, name: str) -> SharedDataset:
+    """Copy the given loaded dataset into shared memory blocks under the given name.
+
+    Parameters
+    ----------
+    result :
+        The loaded dataset, e.g. returned by tsdb.load().
+
+    name :
+        The name to publish the dataset under, used by other processes to attach to it.
+
+    Returns
+    -------
+    shared_dataset :
+        The published dataset, holding one reference to the blocks until detached.
+
+    """
+    layout, shared_arrays = {}, {}
+    for key, value in result.items():
+        if _is_shareable(value):
+            layout[key] = {"type": "ndarray"}
+            shared_arrays[key] = [value]
+        elif isinstance(value, (pd.DataFrame, pd.Series)):
+            frame = value.to_frame() if isinstance(value, pd.Series) else value
+            columns = [frame.iloc[:, i] for i in range(frame.shape[1])]
+            arrays = [
+                c.to_numpy() if isinstance(c.dtype, np.dtype) else c.array
+                for c in columns
+            ]
+            layout[key] = {
+                "type": "Series" if isinstance(value, pd.Series) else "DataFrame",
+                "index": value.index,
+                "name": value.name if isinstance(value, pd.Series) else None,
+                "column_names": frame.columns,
+                # non-numeric columns are kept in the layout as they are
+                "columns": [
+                    (_is_shareable(a), None if _is_shareable(a) else a) for a in arrays
+                ],
+            }
+            shared_arrays[key] = [a for a in arrays if _is_shareable(a)]
+        else:
+            layout[key] = {"type": "object", "value": value}
+
+    data_blocks = {}
+    # attaching processes must not read the header before the layout and the reference count are written
+    with _get_lock(name):
+        try:
+            for i, (key, arrays) in enumerate(shared_arrays.items()):
+                specs, size = _pack_arrays(arrays)
+                block = _open_block(
+                    _block_name(name, i), create=True, size=max(size, 1)
+                )
+                data_blocks[key] = block
+                for spec, array in zip(specs, arrays):
+                    offset, dtype, shape = spec
+                    view = np.ndarray(
+                        shape, dtype=dtype, buffer=block.buf, offset=offset
+                    )
+                    view[...] = array
+                entry = layout[key]
+                if entry["type"] == "ndarray":
+                    entry["array"] = specs[0]
+                else:
+                    specs = iter(specs)
+                    entry["columns"] = [
+                        (shared, next(specs) if shared else spec)
+                        for shared, spec in entry["columns"]
+                    ]
+
+            pickled_layout = pickle.dumps(layout, protocol=pickle.HIGHEST_PROTOCOL)
+            meta_block = _open_block(
+                _block_name(name), create=True, size=_HEADER.size + len(pickled_layout)
+            )
+        except Exception:
+            for block in data_blocks.values():
+                _unlink_block(block)
+                _close_block(block)
+            raise
+
+        meta_block.buf[_HEADER.size : _HEADER.size + len(pickled_layout)] = (
+            pickled_layout
+        )
+        # the publishing process holds the first reference
+        _HEADER.pack_into(meta_block.buf, 0, 1, len(pickled_layout))
+    shared_nbytes = sum(block.size for block in data_blocks.values())
+    logger.info(
+        f"Published {shared_nbytes} bytes of dataset arrays into shared memory under the name {name}."
+    )
+    return SharedDataset(name, layout, meta_block, data_blocks)
+
+
+def attach(name: str) -> SharedDataset:
+    """Attach to a dataset published into shared memory by tsdb.publish(), e.g. in DataLoader workers.
+    Its numeric arrays are zero-copy read-only views. Call detach() on it when done, or use it as a context manager.
+
+    Parameters
+    ----------
+    name :
+        The name the dataset is published under.
+
+    Returns
+    -------
+    shared_dataset :
+        The dataset, holding one reference to the blocks until detached.
+
+    """
+    with _get_lock(name):
+        try:
+            meta_block = _open_block(_block_name(name))
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"No dataset is published under the name {name}, or it has been released by all processes."
+            )
+        ref_count, layout_nbytes = _HEADER.unpack_from(meta_block.buf, 0)
+        _HEADER.pack_into(meta_block.buf, 0, ref_count + 1, layout_nbytes)
+
+    layout = pickle.loads(
+        bytes(meta_block.buf[_HEADER.size : _HEADER.size + layout_nbytes])
+    )
+    data_blocks = {}
+    for i, key in enumerate(
+        k for k, entry in layout.items() if entry["type"] != "object"
+    ):
+        data_blocks[key] = _open_block(_block_name(name, i))
+    return SharedDataset(name, layout, meta_block, data_blocks)